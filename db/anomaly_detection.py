@@ -0,0 +1,223 @@
+"""Online per-agent anomaly detection over incoming traces and spans.
+
+Each agent keeps exponentially weighted statistics, O(1) memory apiece:
+
+* span latency, per span kind, and trace cost as EWMA mean and variance of
+  log1p(value), since both are heavy tailed. A value more than
+  ``threshold`` standard deviations above the mean is a spike.
+* error and signature-failure rates as a fast EWMA of a 0/1 indicator
+  checked against a slow baseline rate. The short-window rate becomes a
+  z-score using the binomial standard error for the fast window's
+  effective sample size.
+
+Values are scored before they update the statistics, nothing is reported
+until a statistic has seen ``warmup`` samples, and each (agent, signal)
+reports at most once per ``cooldown`` so one incident does not flood
+telemetry_anomalies. Agents beyond ``max_agents`` are evicted least
+recently seen first.
+"""
+import math
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models import AnomalyType, SpanStatus, TelemetryAnomaly, TelemetrySpan, TelemetryTrace
+
+# Floor on the log-space standard deviation (about 5%), so a perfectly
+# steady signal still has a finite z-score
+MIN_VARIANCE = 0.05 ** 2
+
+# Lower z-score bound of each severity, highest first
+SEVERITY_THRESHOLDS = (("critical", 8.0), ("high", 5.0), ("medium", 4.0), ("low", 0.0))
+
+
+def severity_for(z_score: float) -> str:
+    for severity, lower in SEVERITY_THRESHOLDS:
+        if z_score >= lower:
+            return severity
+    return "low"
+
+
+class Ewma:
+    """Exponentially weighted mean and variance of a stream."""
+
+    __slots__ = ("alpha", "mean", "variance", "count")
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.mean = 0.0
+        self.variance = 0.0
+        self.count = 0
+
+    def z_score(self, value: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        return (value - self.mean) / math.sqrt(max(self.variance, MIN_VARIANCE))
+
+    def update(self, value: float):
+        if self.count == 0:
+            self.mean = value
+        else:
+            delta = value - self.mean
+            self.mean += self.alpha * delta
+            self.variance = (1 - self.alpha) * (self.variance + self.alpha * delta * delta)
+        self.count += 1
+
+
+class RateTracker:
+    """A 0/1 event rate: a fast EWMA compared against a slow baseline."""
+
+    __slots__ = ("fast", "slow", "count", "effective_samples")
+
+    def __init__(self, fast_alpha: float, slow_alpha: float):
+        self.fast = Ewma(fast_alpha)
+        self.slow = Ewma(slow_alpha)
+        self.count = 0
+        self.effective_samples = (2 - fast_alpha) / fast_alpha
+
+    def update(self, hit: bool) -> Optional[float]:
+        """Add one observation and return the recent rate's z-score against the baseline."""
+        baseline = self.slow.mean if self.count else None
+        self.fast.update(float(hit))
+        self.slow.update(float(hit))
+        self.count += 1
+        if baseline is None:
+            return None
+        # Floor the baseline so an agent that never failed still needs a real
+        # burst, and cap it so one that always fails keeps a nonzero error
+        rate = min(max(baseline, 0.02), 0.98)
+        return (self.fast.mean - rate) / math.sqrt(rate * (1 - rate) / self.effective_samples)
+
+
+class AgentBaseline:
+    __slots__ = ("latency", "cost", "errors", "signature_failures", "last_reported")
+
+    def __init__(self, alpha: float, fast_alpha: float):
+        self.latency: Dict[str, Ewma] = {}
+        self.cost = Ewma(alpha)
+        self.errors = RateTracker(fast_alpha, alpha)
+        self.signature_failures = RateTracker(fast_alpha, alpha)
+        self.last_reported: Dict[str, datetime] = {}
+
+
+class AnomalyDetector:
+    """Scores traces and spans as they are written and returns TelemetryAnomaly rows."""
+
+    def __init__(
+        self,
+        alpha: float = 0.02,
+        fast_alpha: float = 0.05,
+        threshold: float = 3.0,
+        warmup: int = 30,
+        cooldown: timedelta = timedelta(minutes=5),
+        max_agents: int = 10000
+    ):
+        self.alpha = alpha
+        self.fast_alpha = fast_alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.cooldown = cooldown
+        self.max_agents = max_agents
+        self.baselines: "OrderedDict[str, AgentBaseline]" = OrderedDict()
+
+    def baseline(self, agent_id: str) -> AgentBaseline:
+        baseline = self.baselines.get(agent_id)
+        if baseline is None:
+            baseline = self.baselines[agent_id] = AgentBaseline(self.alpha, self.fast_alpha)
+            if len(self.baselines) > self.max_agents:
+                self.baselines.popitem(last=False)
+        else:
+            self.baselines.move_to_end(agent_id)
+        return baseline
+
+    def observe(
+        self,
+        trace: TelemetryTrace,
+        spans: Iterable[TelemetrySpan] = (),
+        emit: bool = True
+    ) -> List[TelemetryAnomaly]:
+        """Fold a trace and its newly written spans into the agent's statistics.
+
+        Returns the anomalies found, unsaved; ``emit=False`` only learns,
+        which is how a detector is primed from history.
+        """
+        baseline = self.baseline(trace.agent_id)
+        found: List[Tuple] = []
+
+        for span in spans:
+            latency = baseline.latency.get(span.kind.value)
+            if latency is None:
+                latency = baseline.latency[span.kind.value] = Ewma(self.alpha)
+            value = math.log1p(max(span.duration_ms, 0))
+            z_score = latency.z_score(value) if latency.count >= self.warmup else None
+            if z_score is not None and z_score >= self.threshold:
+                found.append((AnomalyType.LATENCY_SPIKE, span, z_score, {
+                    "kind": span.kind.value,
+                    "duration_ms": span.duration_ms,
+                    "baseline_ms": round(math.expm1(latency.mean)),
+                }))
+            latency.update(value)
+
+            z_score = baseline.errors.update(span.status != SpanStatus.SUCCESS)
+            if span.status != SpanStatus.SUCCESS and self._rate_anomaly(baseline.errors, z_score):
+                found.append((AnomalyType.ERROR_SPIKE, span, z_score, {
+                    "error_rate": round(baseline.errors.fast.mean, 3),
+                    "baseline_rate": round(baseline.errors.slow.mean, 3),
+                }))
+
+            z_score = baseline.signature_failures.update(not span.signature_verified)
+            if not span.signature_verified and self._rate_anomaly(baseline.signature_failures, z_score):
+                found.append((AnomalyType.SIGNATURE_FAILURE, span, z_score, {
+                    "failure_rate": round(baseline.signature_failures.fast.mean, 3),
+                    "baseline_rate": round(baseline.signature_failures.slow.mean, 3),
+                }))
+
+        if trace.end_timestamp is not None:
+            value = math.log1p(max(trace.cost_cents or 0, 0))
+            z_score = baseline.cost.z_score(value) if baseline.cost.count >= self.warmup else None
+            if z_score is not None and z_score >= self.threshold:
+                found.append((AnomalyType.COST_SPIKE, None, z_score, {
+                    "cost_cents": trace.cost_cents,
+                    "baseline_cents": round(math.expm1(baseline.cost.mean)),
+                }))
+            baseline.cost.update(value)
+
+        if not emit:
+            return []
+        return [
+            anomaly for anomaly in (self._anomaly(baseline, trace, *args) for args in found)
+            if anomaly is not None
+        ]
+
+    def _rate_anomaly(self, tracker: RateTracker, z_score: Optional[float]) -> bool:
+        return tracker.count > self.warmup and z_score is not None and z_score >= self.threshold
+
+    def _anomaly(
+        self,
+        baseline: AgentBaseline,
+        trace: TelemetryTrace,
+        anomaly_type: AnomalyType,
+        span: Optional[TelemetrySpan],
+        z_score: float,
+        details: Dict
+    ) -> Optional[TelemetryAnomaly]:
+        detected_at = span.end_timestamp if span is not None else trace.end_timestamp
+        last = baseline.last_reported.get(anomaly_type.value)
+        if last is not None and abs(detected_at - last) < self.cooldown:
+            return None
+        baseline.last_reported[anomaly_type.value] = detected_at
+        return TelemetryAnomaly(
+            anomaly_id=f"anom_{uuid.uuid4().hex[:16]}",
+            trace_id=trace.trace_id,
+            span_id=span.span_id if span is not None else None,
+            anomaly_type=anomaly_type,
+            severity=severity_for(z_score),
+            details={
+                "description": f"Detected {anomaly_type.value}",
+                "agent_id": trace.agent_id,
+                "z_score": round(z_score, 2),
+                **details
+            },
+            detected_at=detected_at
+        )
@@ -0,0 +1,54 @@
+"""Per-org, per-minute KPI rollup table
+
+Revision ID: 002
+Revises: 001
+Create Date: 2025-01-21 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('kpi_rollups',
+        sa.Column('org_id', sa.String(length=64), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('invocation_count', sa.BigInteger(), nullable=False),
+        sa.Column('cost_cents', sa.BigInteger(), nullable=False),
+        sa.Column('error_spans', sa.BigInteger(), nullable=False),
+        sa.Column('verified_spans', sa.BigInteger(), nullable=False),
+        sa.Column('total_spans', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('org_id', 'bucket')
+    )
+    op.create_index('idx_kpi_rollup_bucket', 'kpi_rollups', ['bucket'], unique=False)
+
+    # Backfill from existing telemetry so the KPIs are continuous across the upgrade
+    op.execute("""
+        INSERT INTO kpi_rollups
+            (org_id, bucket, invocation_count, cost_cents, error_spans, verified_spans, total_spans)
+        SELECT org_id, bucket, SUM(invocations), SUM(cost), SUM(errors), SUM(verified), SUM(spans)
+        FROM (
+            SELECT org_id, date_trunc('minute', start_timestamp) AS bucket,
+                   1 AS invocations, COALESCE(cost_cents, 0) AS cost,
+                   0 AS errors, 0 AS verified, 0 AS spans
+            FROM telemetry_traces
+            UNION ALL
+            SELECT t.org_id, date_trunc('minute', s.start_timestamp),
+                   0, 0,
+                   (s.status = 'ERROR')::int, COALESCE(s.signature_verified, false)::int, 1
+            FROM telemetry_spans s
+            JOIN telemetry_traces t ON t.trace_id = s.trace_id
+        ) AS deltas
+        GROUP BY org_id, bucket
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_kpi_rollup_bucket', table_name='kpi_rollups')
+    op.drop_table('kpi_rollups')
@@ -0,0 +1,43 @@
+"""JSONB agent badges and catalog search indexes
+
+Revision ID: 003
+Revises: 002
+Create Date: 2025-02-04 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.alter_column('agent_registry', 'badges',
+        type_=postgresql.JSONB(),
+        existing_type=sa.JSON(),
+        existing_nullable=True,
+        postgresql_using='badges::jsonb'
+    )
+    # jsonb_path_ops only supports @>, which is all badge filtering needs, and
+    # is smaller and faster than the default jsonb_ops
+    op.create_index('idx_agent_badges', 'agent_registry', ['badges'], unique=False,
+        postgresql_using='gin', postgresql_ops={'badges': 'jsonb_path_ops'})
+    op.create_index('idx_agent_search', 'agent_registry',
+        [sa.text("to_tsvector('simple', name || ' ' || coalesce(description, ''))")],
+        unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('idx_agent_search', table_name='agent_registry')
+    op.drop_index('idx_agent_badges', table_name='agent_registry')
+    op.alter_column('agent_registry', 'badges',
+        type_=sa.JSON(),
+        existing_type=postgresql.JSONB(),
+        existing_nullable=True,
+        postgresql_using='badges::json'
+    )
@@ -0,0 +1,29 @@
+"""Trigram search indexes for span and agent lookup
+
+Revision ID: 004
+Revises: 003
+Create Date: 2025-02-11 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Must match models.SPAN_SEARCH_DOCUMENT so the planner can use it
+    op.execute(
+        "CREATE INDEX idx_span_search ON telemetry_spans USING gin "
+        "((span_id || ' ' || trace_id || ' ' || coalesce(model_name, '') || ' ' || coalesce(excerpts, '')) gin_trgm_ops)"
+    )
+    op.execute('CREATE INDEX idx_trace_agent_trgm ON telemetry_traces USING gin (agent_id gin_trgm_ops)')
+
+
+def downgrade() -> None:
+    op.drop_index('idx_trace_agent_trgm', table_name='telemetry_traces')
+    op.drop_index('idx_span_search', table_name='telemetry_spans')
@@ -0,0 +1,79 @@
+"""Per-minute agent-to-agent edge rollup table
+
+Revision ID: 005
+Revises: 004
+Create Date: 2025-02-25 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from rollups import LATENCY_BOUNDS
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('edge_rollups',
+        sa.Column('org_id', sa.String(length=64), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('from_agent_id', sa.String(length=64), nullable=False),
+        sa.Column('to_agent_id', sa.String(length=64), nullable=False),
+        sa.Column('channel', postgresql.ENUM('A2A', 'MCP', 'HTTP', 'GRPC', 'QUEUE', name='protocol', create_type=False), nullable=False),
+        sa.Column('call_count', sa.BigInteger(), nullable=False),
+        sa.Column('error_count', sa.BigInteger(), nullable=False),
+        sa.Column('unsigned_count', sa.BigInteger(), nullable=False),
+        sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+        sa.Column('latency_sum_ms', sa.BigInteger(), nullable=False),
+        sa.Column('latency_hist', postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.PrimaryKeyConstraint('org_id', 'bucket', 'from_agent_id', 'to_agent_id', 'channel')
+    )
+    op.create_index('idx_edge_rollup_bucket', 'edge_rollups', ['bucket'], unique=False)
+
+    # Backfill from existing edges; latency is measured from the hand-off to
+    # the end of the callee span, bucketed like rollups.latency_bucket
+    op.execute(f"""
+        WITH calls AS (
+            SELECT t.org_id, date_trunc('minute', e.timestamp) AS bucket,
+                   e.from_agent_id, e.to_agent_id, e.channel,
+                   (s.status <> 'SUCCESS')::int AS error,
+                   (NOT COALESCE(e.signature_verified, false))::int AS unsigned,
+                   COALESCE(e.size_bytes, 0) AS size_bytes,
+                   GREATEST(0, floor(extract(epoch FROM s.end_timestamp - e.timestamp) * 1000))::bigint AS latency_ms
+            FROM telemetry_edges e
+            JOIN telemetry_traces t ON t.trace_id = e.trace_id
+            JOIN telemetry_spans s ON s.span_id = e.to_span_id
+        ),
+        slots AS (
+            SELECT org_id, bucket, from_agent_id, to_agent_id, channel,
+                   width_bucket(latency_ms, ARRAY{LATENCY_BOUNDS}::bigint[]) AS slot, count(*) AS n
+            FROM calls
+            GROUP BY 1, 2, 3, 4, 5, 6
+        ),
+        histograms AS (
+            SELECT org_id, bucket, from_agent_id, to_agent_id, channel,
+                   array_agg(slot) AS slots, array_agg(n) AS counts
+            FROM slots
+            GROUP BY 1, 2, 3, 4, 5
+        )
+        INSERT INTO edge_rollups
+            (org_id, bucket, from_agent_id, to_agent_id, channel, call_count, error_count,
+             unsigned_count, size_bytes, latency_sum_ms, latency_hist)
+        SELECT c.org_id, c.bucket, c.from_agent_id, c.to_agent_id, c.channel,
+               count(*), sum(c.error), sum(c.unsigned), sum(c.size_bytes), sum(c.latency_ms),
+               (SELECT array_agg(COALESCE(h.counts[array_position(h.slots, i)], 0)::int ORDER BY i)
+                FROM generate_series(1, {len(LATENCY_BOUNDS)}) AS i)
+        FROM calls c
+        JOIN histograms h USING (org_id, bucket, from_agent_id, to_agent_id, channel)
+        GROUP BY c.org_id, c.bucket, c.from_agent_id, c.to_agent_id, c.channel, h.slots, h.counts
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_edge_rollup_bucket', table_name='edge_rollups')
+    op.drop_table('edge_rollups')
@@ -0,0 +1,92 @@
+"""Daily range partitioning of the telemetry and policy audit tables
+
+Revision ID: 006
+Revises: 005
+Create Date: 2025-03-11 00:00:00.000000
+
+"""
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+from partitions import PARTITIONED_TABLES, default_partition_name, ensure_partitions
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+# Postgres cannot enforce a foreign key that points into a partitioned
+# table, so these are dropped; the ORM still joins on the same columns.
+FOREIGN_KEYS = [
+    ('telemetry_spans_parent_span_id_fkey', 'telemetry_spans', ['parent_span_id'], 'telemetry_spans', ['span_id']),
+    ('telemetry_spans_trace_id_fkey', 'telemetry_spans', ['trace_id'], 'telemetry_traces', ['trace_id']),
+    ('telemetry_edges_from_span_id_fkey', 'telemetry_edges', ['from_span_id'], 'telemetry_spans', ['span_id']),
+    ('telemetry_edges_to_span_id_fkey', 'telemetry_edges', ['to_span_id'], 'telemetry_spans', ['span_id']),
+    ('telemetry_edges_trace_id_fkey', 'telemetry_edges', ['trace_id'], 'telemetry_traces', ['trace_id']),
+    ('telemetry_anomalies_span_id_fkey', 'telemetry_anomalies', ['span_id'], 'telemetry_spans', ['span_id']),
+    ('telemetry_anomalies_trace_id_fkey', 'telemetry_anomalies', ['trace_id'], 'telemetry_traces', ['trace_id']),
+    ('policy_audit_trace_id_fkey', 'policy_audit', ['trace_id'], 'telemetry_traces', ['trace_id']),
+]
+
+# The tables this revision partitions; later revisions add their own
+# tables to PARTITIONED_TABLES.
+TABLES = ["telemetry_traces", "telemetry_spans", "telemetry_edges", "telemetry_anomalies", "policy_audit"]
+
+# Partitions created up front around the upgrade, besides every day that
+# already has rows; the partition maintenance job keeps extending them.
+PAST_DAYS = 30
+AHEAD_DAYS = 7
+
+
+def secondary_index_definitions(conn, table):
+    return conn.execute(sa.text(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() "
+        "AND tablename = :table AND indexname <> :pkey"
+    ), {"table": table, "pkey": f"{table}_pkey"}).scalars().all()
+
+
+def rebuild_table(conn, table, partitioned):
+    """Copy a table into a partitioned (or plain) replacement of the same name."""
+    column, id_column = PARTITIONED_TABLES[table]
+    indexes = secondary_index_definitions(conn, table)
+    previous = f"{table}_previous"
+
+    op.rename_table(table, previous)
+    if partitioned:
+        op.execute(f"CREATE TABLE {table} (LIKE {previous} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                   f"PARTITION BY RANGE ({column})")
+        op.execute(f"CREATE TABLE {default_partition_name(table)} PARTITION OF {table} DEFAULT")
+        today = datetime.utcnow().date()
+        days = set(conn.execute(sa.text(
+            f"SELECT DISTINCT CAST(date_trunc('day', {column}) AS date) FROM {previous}"
+        )).scalars())
+        days.update(today + timedelta(days=n) for n in range(-PAST_DAYS, AHEAD_DAYS + 1))
+        ensure_partitions(conn, table, days)
+    else:
+        op.execute(f"CREATE TABLE {table} (LIKE {previous} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+
+    op.execute(f"INSERT INTO {table} SELECT * FROM {previous}")
+    op.execute(f"DROP TABLE {previous}")
+    # A primary key on a partitioned table has to include the partition column
+    op.create_primary_key(f"{table}_pkey", table, [id_column, column] if partitioned else [id_column])
+    for definition in indexes:
+        op.execute(definition)
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    for name, table, _, _, _ in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+    for table in TABLES:
+        rebuild_table(conn, table, partitioned=True)
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    for table in TABLES:
+        rebuild_table(conn, table, partitioned=False)
+    for name, table, columns, referent, remote_columns in FOREIGN_KEYS:
+        op.create_foreign_key(name, table, referent, columns, remote_columns)
@@ -0,0 +1,40 @@
+"""Per-hour span summary table for compacted telemetry
+
+Revision ID: 007
+Revises: 006
+Create Date: 2025-03-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('span_rollups',
+        sa.Column('org_id', sa.String(length=64), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('agent_id', sa.String(length=64), nullable=False),
+        sa.Column('model_name', sa.String(length=64), nullable=False),
+        sa.Column('span_count', sa.BigInteger(), nullable=False),
+        sa.Column('error_count', sa.BigInteger(), nullable=False),
+        sa.Column('verified_count', sa.BigInteger(), nullable=False),
+        sa.Column('tokens_in', sa.BigInteger(), nullable=False),
+        sa.Column('tokens_out', sa.BigInteger(), nullable=False),
+        sa.Column('cost_cents', sa.BigInteger(), nullable=False),
+        sa.Column('duration_sum_ms', sa.BigInteger(), nullable=False),
+        sa.Column('duration_hist', postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.PrimaryKeyConstraint('org_id', 'bucket', 'agent_id', 'model_name')
+    )
+    op.create_index('idx_span_rollup_bucket', 'span_rollups', ['bucket'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_span_rollup_bucket', table_name='span_rollups')
+    op.drop_table('span_rollups')
@@ -0,0 +1,35 @@
+"""Anomaly types reported by the online detector
+
+Revision ID: 008
+Revises: 007
+Create Date: 2025-03-25 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+ORIGINAL_TYPES = ('INJECTION_ATTEMPT', 'TOOL_ABUSE', 'SIGNATURE_FAILURE', 'BUDGET_EXCEEDED')
+DETECTOR_TYPES = ('LATENCY_SPIKE', 'COST_SPIKE', 'ERROR_SPIKE')
+
+
+def upgrade() -> None:
+    for name in DETECTOR_TYPES:
+        op.execute(f"ALTER TYPE anomalytype ADD VALUE IF NOT EXISTS '{name}'")
+
+
+def downgrade() -> None:
+    # Postgres cannot drop enum values, so rebuild the type without them
+    names = ", ".join(f"'{name}'" for name in DETECTOR_TYPES)
+    op.execute(f"DELETE FROM telemetry_anomalies WHERE anomaly_type::text IN ({names})")
+    op.execute("ALTER TYPE anomalytype RENAME TO anomalytype_old")
+    op.execute(f"CREATE TYPE anomalytype AS ENUM ({', '.join(repr(name) for name in ORIGINAL_TYPES)})")
+    op.execute(
+        "ALTER TABLE telemetry_anomalies ALTER COLUMN anomaly_type "
+        "TYPE anomalytype USING anomaly_type::text::anomalytype"
+    )
+    op.execute("DROP TYPE anomalytype_old")
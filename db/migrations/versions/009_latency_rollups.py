@@ -0,0 +1,68 @@
+"""Per-minute span latency histograms per agent, kind and model
+
+Revision ID: 009
+Revises: 008
+Create Date: 2025-04-01 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from rollups import LATENCY_BOUNDS
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('latency_rollups',
+        sa.Column('org_id', sa.String(length=64), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('agent_id', sa.String(length=64), nullable=False),
+        sa.Column('kind', postgresql.ENUM('PROMPT', 'TOOL', 'SUBAGENT', 'SYSTEM', 'NETWORK', name='spankind', create_type=False), nullable=False),
+        sa.Column('model_name', sa.String(length=64), nullable=False),
+        sa.Column('span_count', sa.BigInteger(), nullable=False),
+        sa.Column('duration_sum_ms', sa.BigInteger(), nullable=False),
+        sa.Column('duration_hist', postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.PrimaryKeyConstraint('org_id', 'bucket', 'agent_id', 'kind', 'model_name')
+    )
+    op.create_index('idx_latency_rollup_bucket', 'latency_rollups', ['bucket'], unique=False)
+
+    # Backfill from the spans still stored raw, bucketed like rollups.latency_bucket
+    op.execute(f"""
+        WITH spans AS (
+            SELECT t.org_id, date_trunc('minute', s.start_timestamp) AS bucket, t.agent_id, s.kind,
+                   COALESCE(s.model_name, '') AS model_name, s.duration_ms,
+                   width_bucket(s.duration_ms, ARRAY{LATENCY_BOUNDS}::int[]) AS slot
+            FROM telemetry_spans s
+            JOIN telemetry_traces t ON t.trace_id = s.trace_id
+        ),
+        slots AS (
+            SELECT org_id, bucket, agent_id, kind, model_name, slot, count(*) AS n
+            FROM spans
+            GROUP BY 1, 2, 3, 4, 5, 6
+        ),
+        groups AS (
+            SELECT org_id, bucket, agent_id, kind, model_name,
+                   count(*) AS span_count, sum(duration_ms) AS duration_sum_ms
+            FROM spans
+            GROUP BY 1, 2, 3, 4, 5
+        )
+        INSERT INTO latency_rollups
+            (org_id, bucket, agent_id, kind, model_name, span_count, duration_sum_ms, duration_hist)
+        SELECT org_id, bucket, agent_id, kind, model_name, span_count, duration_sum_ms,
+               array_agg(COALESCE(n, 0)::int ORDER BY slot)
+        FROM groups
+        CROSS JOIN generate_series(1, {len(LATENCY_BOUNDS)}) AS slot
+        LEFT JOIN slots USING (org_id, bucket, agent_id, kind, model_name, slot)
+        GROUP BY org_id, bucket, agent_id, kind, model_name, span_count, duration_sum_ms
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_latency_rollup_bucket', table_name='latency_rollups')
+    op.drop_table('latency_rollups')
@@ -0,0 +1,27 @@
+"""Cost already attributed to span rollups for partly compacted traces
+
+Revision ID: 010
+Revises: 009
+Create Date: 2025-04-08 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('compacted_trace_costs',
+        sa.Column('trace_id', sa.String(length=64), nullable=False),
+        sa.Column('cost_cents', sa.Numeric(), nullable=False),
+        sa.PrimaryKeyConstraint('trace_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('compacted_trace_costs')
@@ -0,0 +1,27 @@
+"""Traces with rows ingested ahead of the trace itself
+
+Revision ID: 011
+Revises: 010
+Create Date: 2025-04-10 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('ingest_orphan_traces',
+        sa.Column('trace_id', sa.String(length=64), nullable=False),
+        sa.Column('first_seen', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('trace_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ingest_orphan_traces')
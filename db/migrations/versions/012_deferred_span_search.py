@@ -0,0 +1,72 @@
+"""Span search documents indexed off the write path
+
+Revision ID: 012
+Revises: 011
+Create Date: 2025-04-24 00:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+from partitions import PARTITION_SUFFIX, default_partition_name, ensure_partitions, existing_partitions
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+# search_index.span_search_document as of this revision
+SPAN_SEARCH_DOCUMENT = "(span_id || ' ' || trace_id || ' ' || coalesce(model_name, '') || ' ' || coalesce(excerpts, ''))"
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    # No primary key: searches group hits by span, and maintaining a btree
+    # on random ids would cost about as much as the trigram index itself
+    op.execute(
+        "CREATE TABLE span_search ("
+        "span_id VARCHAR(64) NOT NULL, "
+        "start_timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+        "document TEXT NOT NULL"
+        ") PARTITION BY RANGE (start_timestamp)"
+    )
+    op.execute(f"CREATE TABLE {default_partition_name('span_search')} PARTITION OF span_search DEFAULT")
+    days = [
+        datetime.strptime(match.group(1), "%Y%m%d").date()
+        for match in map(PARTITION_SUFFIX.search, existing_partitions(conn, 'telemetry_spans'))
+        if match
+    ]
+    ensure_partitions(conn, 'span_search', days)
+
+    op.create_table('span_search_queue',
+        sa.Column('span_id', sa.String(length=64), nullable=False),
+        sa.Column('start_timestamp', sa.DateTime(), nullable=False),
+        sa.Column('document', sa.Text(), nullable=False)
+    )
+
+    # Building the trigram index after the backfill is much cheaper than
+    # maintaining it row by row
+    op.execute(
+        f"INSERT INTO span_search (span_id, start_timestamp, document) "
+        f"SELECT span_id, start_timestamp, {SPAN_SEARCH_DOCUMENT} FROM telemetry_spans"
+    )
+    # The indexer inserts in batches; a 64MB pending list lets GIN merge
+    # each batch into the index in bulk instead of every few hundred rows
+    op.execute(
+        'CREATE INDEX idx_span_search_document ON span_search USING gin (document gin_trgm_ops) '
+        'WITH (gin_pending_list_limit = 65536)'
+    )
+    op.drop_index('idx_span_search', table_name='telemetry_spans')
+
+
+def downgrade() -> None:
+    op.execute(
+        "CREATE INDEX idx_span_search ON telemetry_spans USING gin "
+        f"({SPAN_SEARCH_DOCUMENT} gin_trgm_ops)"
+    )
+    op.drop_table('span_search_queue')
+    # Drops the partitions with it
+    op.drop_table('span_search')
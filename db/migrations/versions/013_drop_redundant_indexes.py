@@ -0,0 +1,35 @@
+"""Drop single-column indexes that duplicate a composite index's prefix
+
+Revision ID: 013
+Revises: 012
+Create Date: 2025-04-24 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+# index -> (table, column); each column leads one of the table's
+# (column, timestamp) indexes, which serve the same lookups, so these only
+# add work to every insert
+INDEXES = {
+    'ix_telemetry_traces_agent_id': ('telemetry_traces', 'agent_id'),
+    'ix_telemetry_traces_org_id': ('telemetry_traces', 'org_id'),
+    'ix_telemetry_spans_trace_id': ('telemetry_spans', 'trace_id'),
+    'ix_telemetry_edges_trace_id': ('telemetry_edges', 'trace_id'),
+    'ix_telemetry_anomalies_trace_id': ('telemetry_anomalies', 'trace_id'),
+}
+
+
+def upgrade() -> None:
+    for name, (table, _) in INDEXES.items():
+        op.drop_index(name, table_name=table)
+
+
+def downgrade() -> None:
+    for name, (table, column) in INDEXES.items():
+        op.create_index(name, table, [column], unique=False)
@@ -0,0 +1,33 @@
+"""Drop telemetry indexes that no query uses
+
+Revision ID: 014
+Revises: 013
+Create Date: 2025-04-24 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+# index -> (table, column). Edges are looked up by trace and aggregated
+# through edge_rollups, and spans are fetched by trace to build the tree,
+# so these were only ever written to
+INDEXES = {
+    'idx_edge_from_agent': ('telemetry_edges', 'from_agent_id'),
+    'idx_edge_to_agent': ('telemetry_edges', 'to_agent_id'),
+    'idx_span_parent': ('telemetry_spans', 'parent_span_id'),
+}
+
+
+def upgrade() -> None:
+    for name, (table, _) in INDEXES.items():
+        op.drop_index(name, table_name=table)
+
+
+def downgrade() -> None:
+    for name, (table, column) in INDEXES.items():
+        op.create_index(name, table, [column], unique=False)
@@ -1,8 +1,9 @@
 """Database models for AgentOS Mock."""
 from sqlalchemy import (
     Column, String, Integer, BigInteger, Float, Boolean, DateTime, Text,
-    JSON, ForeignKey, Enum as SQLEnum, Index
+    JSON, Numeric, ForeignKey, Enum as SQLEnum, Index, text
 )
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -38,16 +39,23 @@ class AnomalyType(str, enum.Enum):
     TOOL_ABUSE = "tool_abuse"
     SIGNATURE_FAILURE = "signature_failure"
     BUDGET_EXCEEDED = "budget_exceeded"
+    LATENCY_SPIKE = "latency_spike"
+    COST_SPIKE = "cost_spike"
+    ERROR_SPIKE = "error_spike"
 
 
+# The telemetry tables and policy_audit are range partitioned by day
+# (migration 006, partitions.py). In the database their primary keys also
+# include the partition column and the foreign keys between them are not
+# enforced; the declarations below still give the ORM its identity and joins.
 class TelemetryTrace(Base):
     __tablename__ = "telemetry_traces"
 
     trace_id = Column(String(64), primary_key=True)
     invocation_id = Column(String(64), nullable=False)
-    org_id = Column(String(64), nullable=False, index=True)
+    org_id = Column(String(64), nullable=False)
     project_id = Column(String(64), nullable=False, index=True)
-    agent_id = Column(String(64), nullable=False, index=True)
+    agent_id = Column(String(64), nullable=False)
     version_id = Column(String(64), nullable=False)
     protocol = Column(SQLEnum(Protocol), nullable=False)
     run_mode = Column(String(32), nullable=False)
@@ -59,6 +67,8 @@ class TelemetryTrace(Base):
 
     # Relationships
     spans = relationship("TelemetrySpan", back_populates="trace", cascade="all, delete-orphan")
+    edges = relationship("TelemetryEdge", order_by="TelemetryEdge.timestamp", viewonly=True)
+    anomalies = relationship("TelemetryAnomaly", order_by="TelemetryAnomaly.detected_at", viewonly=True)
 
     __table_args__ = (
         Index("idx_trace_org_time", "org_id", "start_timestamp"),
@@ -70,7 +80,7 @@ class TelemetrySpan(Base):
     __tablename__ = "telemetry_spans"
 
     span_id = Column(String(64), primary_key=True)
-    trace_id = Column(String(64), ForeignKey("telemetry_traces.trace_id"), nullable=False, index=True)
+    trace_id = Column(String(64), ForeignKey("telemetry_traces.trace_id"), nullable=False)
     parent_span_id = Column(String(64), ForeignKey("telemetry_spans.span_id"), nullable=True)
     kind = Column(SQLEnum(SpanKind), nullable=False)
 
@@ -110,7 +120,6 @@ class TelemetrySpan(Base):
 
     __table_args__ = (
         Index("idx_span_trace", "trace_id", "start_timestamp"),
-        Index("idx_span_parent", "parent_span_id"),
     )
 
 
@@ -118,7 +127,7 @@ class TelemetryEdge(Base):
     __tablename__ = "telemetry_edges"
 
     edge_id = Column(String(64), primary_key=True)
-    trace_id = Column(String(64), ForeignKey("telemetry_traces.trace_id"), nullable=False, index=True)
+    trace_id = Column(String(64), ForeignKey("telemetry_traces.trace_id"), nullable=False)
 
     # Agent information
     from_agent_id = Column(String(64), nullable=False)
@@ -141,8 +150,6 @@ class TelemetryEdge(Base):
 
     __table_args__ = (
         Index("idx_edge_trace", "trace_id", "timestamp"),
-        Index("idx_edge_from_agent", "from_agent_id"),
-        Index("idx_edge_to_agent", "to_agent_id"),
     )
 
 
@@ -150,7 +157,7 @@ class TelemetryAnomaly(Base):
     __tablename__ = "telemetry_anomalies"
 
     anomaly_id = Column(String(64), primary_key=True)
-    trace_id = Column(String(64), ForeignKey("telemetry_traces.trace_id"), nullable=False, index=True)
+    trace_id = Column(String(64), ForeignKey("telemetry_traces.trace_id"), nullable=False)
     span_id = Column(String(64), ForeignKey("telemetry_spans.span_id"), nullable=True)
 
     anomaly_type = Column(SQLEnum(AnomalyType), nullable=False)
@@ -204,6 +211,11 @@ class PolicyAudit(Base):
     )
 
 
+# Full-text document for catalog search. Queries must use this exact
+# expression for Postgres to match it to idx_agent_search.
+AGENT_SEARCH_DOCUMENT = "to_tsvector('simple', name || ' ' || coalesce(description, ''))"
+
+
 class AgentRegistry(Base):
     __tablename__ = "agent_registry"
 
@@ -217,7 +229,7 @@ class AgentRegistry(Base):
     protocol = Column(SQLEnum(Protocol), nullable=False)
 
     health_status = Column(String(16), nullable=False, default="unknown")
-    badges = Column(JSON, nullable=True, default=dict)
+    badges = Column(JSONB, nullable=True, default=dict)
 
     last_health_check = Column(DateTime, nullable=True)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -225,4 +237,157 @@ class AgentRegistry(Base):
 
     __table_args__ = (
         Index("idx_agent_org", "org_id", "project_id"),
+        Index("idx_agent_badges", "badges", postgresql_using="gin", postgresql_ops={"badges": "jsonb_path_ops"}),
+        Index("idx_agent_search", text(AGENT_SEARCH_DOCUMENT), postgresql_using="gin"),
+    )
+
+
+class KpiRollup(Base):
+    """Per-org, per-minute counters maintained as traces and spans are written."""
+    __tablename__ = "kpi_rollups"
+
+    org_id = Column(String(64), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+
+    invocation_count = Column(BigInteger, nullable=False, default=0)
+    cost_cents = Column(BigInteger, nullable=False, default=0)
+    error_spans = Column(BigInteger, nullable=False, default=0)
+    verified_spans = Column(BigInteger, nullable=False, default=0)
+    total_spans = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("idx_kpi_rollup_bucket", "bucket"),
+    )
+
+
+class EdgeRollup(Base):
+    """Per-minute agent-to-agent call counters maintained as edges are written.
+
+    ``latency_hist`` is a fixed-layout log-linear histogram (see
+    rollups.LATENCY_BOUNDS) so minutes can be merged by adding arrays.
+    """
+    __tablename__ = "edge_rollups"
+
+    org_id = Column(String(64), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    from_agent_id = Column(String(64), primary_key=True)
+    to_agent_id = Column(String(64), primary_key=True)
+    channel = Column(SQLEnum(Protocol), primary_key=True)
+
+    call_count = Column(BigInteger, nullable=False, default=0)
+    error_count = Column(BigInteger, nullable=False, default=0)
+    unsigned_count = Column(BigInteger, nullable=False, default=0)
+    size_bytes = Column(BigInteger, nullable=False, default=0)
+    latency_sum_ms = Column(BigInteger, nullable=False, default=0)
+    latency_hist = Column(ARRAY(Integer), nullable=False)
+
+    __table_args__ = (
+        Index("idx_edge_rollup_bucket", "bucket"),
+    )
+
+
+class SpanRollup(Base):
+    """Per-hour span summaries per (org, agent, model) left behind by compaction.
+
+    compaction.py folds aged spans in here and then removes the raw rows,
+    so a span is counted either here or in telemetry_spans, never both.
+    ``model_name`` is '' for spans that did not call a model, and
+    ``duration_hist`` uses the rollups.LATENCY_BOUNDS layout.
+    """
+    __tablename__ = "span_rollups"
+
+    org_id = Column(String(64), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    agent_id = Column(String(64), primary_key=True)
+    model_name = Column(String(64), primary_key=True)
+
+    span_count = Column(BigInteger, nullable=False, default=0)
+    error_count = Column(BigInteger, nullable=False, default=0)
+    verified_count = Column(BigInteger, nullable=False, default=0)
+    tokens_in = Column(BigInteger, nullable=False, default=0)
+    tokens_out = Column(BigInteger, nullable=False, default=0)
+    cost_cents = Column(BigInteger, nullable=False, default=0)
+    duration_sum_ms = Column(BigInteger, nullable=False, default=0)
+    duration_hist = Column(ARRAY(Integer), nullable=False)
+
+    __table_args__ = (
+        Index("idx_span_rollup_bucket", "bucket"),
     )
+
+
+class CompactedTraceCost(Base):
+    """Cost already attributed to span_rollups for traces only partly compacted.
+
+    A trace whose spans straddle day partitions is compacted a day at a
+    time; its later days split what is left of its cost over what is left
+    of its spans, so the shares add up to the trace's cost exactly once.
+    Rows are removed when a trace's last stored span is compacted.
+    """
+    __tablename__ = "compacted_trace_costs"
+
+    trace_id = Column(String(64), primary_key=True)
+    cost_cents = Column(Numeric, nullable=False)
+
+
+class LatencyRollup(Base):
+    """Per-minute span duration histograms per (org, agent, span kind, model).
+
+    Maintained as spans are written; ``duration_hist`` uses the
+    rollups.LATENCY_BOUNDS layout and ``model_name`` is '' for spans that
+    did not call a model.
+    """
+    __tablename__ = "latency_rollups"
+
+    org_id = Column(String(64), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    agent_id = Column(String(64), primary_key=True)
+    kind = Column(SQLEnum(SpanKind), primary_key=True)
+    model_name = Column(String(64), primary_key=True)
+
+    span_count = Column(BigInteger, nullable=False, default=0)
+    duration_sum_ms = Column(BigInteger, nullable=False, default=0)
+    duration_hist = Column(ARRAY(Integer), nullable=False)
+
+    __table_args__ = (
+        Index("idx_latency_rollup_bucket", "bucket"),
+    )
+
+
+class IngestOrphanTrace(Base):
+    """Traces that have spans, edges or anomalies stored but no trace row yet.
+
+    The ingest writer cannot attribute such rows to an org or agent, so it
+    leaves them out of the rollups and live events, records the trace here
+    and folds them in when the trace row is written.
+    """
+    __tablename__ = "ingest_orphan_traces"
+
+    trace_id = Column(String(64), primary_key=True)
+    first_seen = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Span search documents (see search_index.py). Neither table has a primary
+# key in the database, which keeps inserts cheap; the ORM is given the
+# span's key as their identity. span_search is partitioned by day like
+# telemetry_spans, and its gin_trgm_ops index lives only in migration 012
+# because it needs the pg_trgm extension.
+class SpanSearch(Base):
+    """Search documents of indexed spans."""
+    __tablename__ = "span_search"
+
+    span_id = Column(String(64), nullable=False)
+    start_timestamp = Column(DateTime, nullable=False)
+    document = Column(Text, nullable=False)
+
+    __mapper_args__ = {"primary_key": [span_id, start_timestamp]}
+
+
+class SpanSearchQueue(Base):
+    """Search documents of spans written but not yet moved into span_search."""
+    __tablename__ = "span_search_queue"
+
+    span_id = Column(String(64), nullable=False)
+    start_timestamp = Column(DateTime, nullable=False)
+    document = Column(Text, nullable=False)
+
+    __mapper_args__ = {"primary_key": [span_id, start_timestamp]}
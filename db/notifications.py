@@ -0,0 +1,92 @@
+"""Postgres NOTIFY payloads that feed the api-mock live tail.
+
+Writers execute ``notify_live_events`` inside the transaction that stores
+the telemetry. Postgres only delivers notifications on commit, so
+subscribers never see rows that were rolled back, and every api-mock
+process shares one LISTEN connection instead of polling.
+"""
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from models import SpanStatus, TelemetryAnomaly, TelemetrySpan, TelemetryTrace
+
+LIVE_CHANNEL = "telemetry_live"
+
+LIVE_EVENT_TYPES = ("trace", "error_span", "anomaly")
+
+
+def live_events(
+    traces: Iterable[TelemetryTrace] = (),
+    spans: Iterable[TelemetrySpan] = (),
+    anomalies: Iterable[TelemetryAnomaly] = (),
+    trace_owners: Optional[Dict[str, Tuple[str, str]]] = None
+) -> List[Dict]:
+    """Build events for completed traces, spans that did not succeed and anomalies.
+
+    Spans and anomalies are attributed to their trace's (org_id, agent_id);
+    ``trace_owners`` supplies it for traces written in an earlier batch.
+    Rows with no known owner are skipped. Payloads stay small because
+    NOTIFY caps them at 8000 bytes; subscribers fetch details by id.
+    """
+    owners = dict(trace_owners or {})
+    events = []
+
+    for trace in traces:
+        owners[trace.trace_id] = (trace.org_id, trace.agent_id)
+        if trace.end_timestamp is None:
+            continue
+        events.append({
+            "type": "trace",
+            "org_id": trace.org_id,
+            "agent_id": trace.agent_id,
+            "trace_id": trace.trace_id,
+            "cost_cents": trace.cost_cents or 0,
+            "duration_ms": int((trace.end_timestamp - trace.start_timestamp).total_seconds() * 1000),
+            "at": trace.end_timestamp.isoformat(),
+        })
+
+    for span in spans:
+        owner = owners.get(span.trace_id)
+        if span.status == SpanStatus.SUCCESS or owner is None:
+            continue
+        events.append({
+            "type": "error_span",
+            "org_id": owner[0],
+            "agent_id": owner[1],
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "kind": span.kind.value,
+            "status": span.status.value,
+            "model_name": span.model_name,
+            "at": span.end_timestamp.isoformat(),
+        })
+
+    for anomaly in anomalies:
+        owner = owners.get(anomaly.trace_id)
+        if owner is None:
+            continue
+        events.append({
+            "type": "anomaly",
+            "org_id": owner[0],
+            "agent_id": owner[1],
+            "trace_id": anomaly.trace_id,
+            "span_id": anomaly.span_id,
+            "anomaly_id": anomaly.anomaly_id,
+            "anomaly_type": anomaly.anomaly_type.value,
+            "severity": anomaly.severity,
+            "at": anomaly.detected_at.isoformat(),
+        })
+
+    return events
+
+
+def notify_live_events(events: List[Dict]):
+    """Build one statement that NOTIFYs every event on the live channel."""
+    return text(
+        "SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"
+    ).bindparams(
+        channel=LIVE_CHANNEL,
+        payloads=[json.dumps(event, separators=(",", ":")) for event in events]
+    )
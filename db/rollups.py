@@ -0,0 +1,233 @@
+"""Write-time rollups that keep dashboard KPIs off the raw telemetry tables."""
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert
+
+from models import EdgeRollup, KpiRollup, LatencyRollup, SpanStatus, TelemetryEdge, TelemetrySpan, TelemetryTrace
+
+KPI_COUNTERS = ("invocation_count", "cost_cents", "error_spans", "verified_spans", "total_spans")
+
+EDGE_COUNTERS = ("call_count", "error_count", "unsigned_count", "size_bytes", "latency_sum_ms")
+
+LATENCY_COUNTERS = ("span_count", "duration_sum_ms")
+
+SPAN_COUNTERS = (
+    "span_count", "error_count", "verified_count", "tokens_in", "tokens_out", "cost_cents", "duration_sum_ms"
+)
+
+# Lower bounds (ms) of the log-linear latency histogram buckets: one bucket
+# per millisecond below 8 ms, then every power of two split into 8 equal
+# buckets (at most 12.5% relative error) up to 2**21 ms; slower values land
+# in the last bucket. Rollup rows store counts in this layout, so it must
+# only ever be extended, never reshaped.
+LATENCY_BOUNDS = list(range(8)) + [(8 + sub) << (exponent - 3) for exponent in range(3, 21) for sub in range(8)]
+
+
+def latency_bucket(latency_ms: int) -> int:
+    """Index of the histogram bucket holding a latency."""
+    return max(0, bisect_right(LATENCY_BOUNDS, latency_ms) - 1)
+
+
+def histogram_quantile(counts: Sequence[int], fraction: float) -> Optional[int]:
+    """Approximate quantile of a LATENCY_BOUNDS histogram (bucket midpoint)."""
+    total = sum(counts)
+    if not total:
+        return None
+    target = fraction * total
+    seen = 0
+    for index, count in enumerate(counts):
+        seen += count
+        if count and seen >= target:
+            lower = LATENCY_BOUNDS[index]
+            upper = LATENCY_BOUNDS[index + 1] if index + 1 < len(LATENCY_BOUNDS) else lower
+            return (lower + upper) // 2
+    return LATENCY_BOUNDS[-1]
+
+
+def minute_bucket(timestamp: datetime) -> datetime:
+    """Truncate a timestamp to the start of its minute."""
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def kpi_rollup_rows(
+    traces: Iterable[TelemetryTrace],
+    spans: Iterable[TelemetrySpan],
+    org_by_trace: Optional[Dict[str, str]] = None
+) -> List[Dict]:
+    """Fold newly written traces and spans into per-org, per-minute counter deltas.
+
+    Spans are attributed to their trace's org; ``org_by_trace`` supplies the
+    org for spans whose trace was written in an earlier batch. Spans with no
+    known org are skipped.
+    """
+    org_by_trace = dict(org_by_trace or {})
+    deltas = defaultdict(lambda: dict.fromkeys(KPI_COUNTERS, 0))
+
+    for trace in traces:
+        org_by_trace[trace.trace_id] = trace.org_id
+        counters = deltas[(trace.org_id, minute_bucket(trace.start_timestamp))]
+        counters["invocation_count"] += 1
+        counters["cost_cents"] += trace.cost_cents or 0
+
+    for span in spans:
+        org_id = org_by_trace.get(span.trace_id)
+        if org_id is None:
+            continue
+        counters = deltas[(org_id, minute_bucket(span.start_timestamp))]
+        counters["total_spans"] += 1
+        if span.status == SpanStatus.ERROR:
+            counters["error_spans"] += 1
+        if span.signature_verified:
+            counters["verified_spans"] += 1
+
+    return [
+        {"org_id": org_id, "bucket": bucket, **counters}
+        for (org_id, bucket), counters in sorted(deltas.items())
+    ]
+
+
+def edge_latency_ms(edge: TelemetryEdge, to_span: TelemetrySpan) -> int:
+    """Call latency of an edge: from the hand-off until the callee span finished."""
+    return max(0, int((to_span.end_timestamp - edge.timestamp).total_seconds() * 1000))
+
+
+def edge_rollup_rows(
+    edges: Iterable[TelemetryEdge],
+    spans: Iterable[TelemetrySpan],
+    org_by_trace: Dict[str, str]
+) -> List[Dict]:
+    """Fold newly written edges into per-minute deltas per (org, caller, callee, channel).
+
+    An edge counts as an error when its callee span did not succeed. Edges
+    whose callee span is not in ``spans`` are counted without a latency, and
+    edges with no known org are skipped.
+    """
+    spans_by_id = {s.span_id: s for s in spans}
+    deltas = {}
+
+    for edge in edges:
+        org_id = org_by_trace.get(edge.trace_id)
+        if org_id is None:
+            continue
+        key = (org_id, minute_bucket(edge.timestamp), edge.from_agent_id, edge.to_agent_id, edge.channel)
+        row = deltas.get(key)
+        if row is None:
+            row = deltas[key] = dict.fromkeys(EDGE_COUNTERS, 0)
+            row["latency_hist"] = [0] * len(LATENCY_BOUNDS)
+        row["call_count"] += 1
+        row["size_bytes"] += edge.size_bytes or 0
+        if not edge.signature_verified:
+            row["unsigned_count"] += 1
+
+        to_span = spans_by_id.get(edge.to_span_id)
+        if to_span is not None:
+            latency_ms = edge_latency_ms(edge, to_span)
+            row["latency_sum_ms"] += latency_ms
+            row["latency_hist"][latency_bucket(latency_ms)] += 1
+            if to_span.status != SpanStatus.SUCCESS:
+                row["error_count"] += 1
+
+    return [
+        {"org_id": org_id, "bucket": bucket, "from_agent_id": from_agent, "to_agent_id": to_agent,
+         "channel": channel, **row}
+        for (org_id, bucket, from_agent, to_agent, channel), row in sorted(deltas.items())
+    ]
+
+
+def merged_histogram(table: str, column: str):
+    """SQL for an upsert that adds the incoming histogram to the stored one slot by slot."""
+    return literal_column(
+        f"(SELECT array_agg(a + b ORDER BY i) "
+        f"FROM unnest({table}.{column}, excluded.{column}) WITH ORDINALITY AS h(a, b, i))"
+    )
+
+
+def upsert_edge_rollups(rows: Optional[List[Dict]] = None):
+    """Build an INSERT .. ON CONFLICT statement that adds edge deltas, histograms included."""
+    stmt = insert(EdgeRollup)
+    if rows is not None:
+        stmt = stmt.values(rows)
+    set_ = {name: getattr(EdgeRollup, name) + getattr(stmt.excluded, name) for name in EDGE_COUNTERS}
+    set_["latency_hist"] = merged_histogram("edge_rollups", "latency_hist")
+    return stmt.on_conflict_do_update(
+        index_elements=[
+            EdgeRollup.org_id, EdgeRollup.bucket, EdgeRollup.from_agent_id,
+            EdgeRollup.to_agent_id, EdgeRollup.channel
+        ],
+        set_=set_
+    )
+
+
+def upsert_kpi_rollups(rows: Optional[List[Dict]] = None):
+    """Build an INSERT .. ON CONFLICT statement that adds the deltas to existing buckets.
+
+    Execute it in the same transaction as the telemetry write so the rollup
+    never drifts from the rows it summarizes. Every upsert_* builder embeds
+    ``rows`` as one multi-row VALUES statement; called without rows it
+    returns a statement to execute with the rows as executemany parameters,
+    which compiles once whatever the batch size and suits large batches.
+    Rollup rows come sorted by key, so concurrent writers lock buckets in
+    the same order and cannot deadlock on each other.
+    """
+    stmt = insert(KpiRollup)
+    if rows is not None:
+        stmt = stmt.values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[KpiRollup.org_id, KpiRollup.bucket],
+        set_={name: getattr(KpiRollup, name) + getattr(stmt.excluded, name) for name in KPI_COUNTERS}
+    )
+
+
+def latency_rollup_rows(
+    traces: Iterable[TelemetryTrace],
+    spans: Iterable[TelemetrySpan],
+    trace_owners: Optional[Dict[str, Tuple[str, str]]] = None
+) -> List[Dict]:
+    """Fold newly written spans into per-minute histograms per (org, agent, kind, model).
+
+    Spans are attributed to their trace's (org_id, agent_id);
+    ``trace_owners`` supplies it for spans whose trace was written in an
+    earlier batch. Spans with no known owner are skipped.
+    """
+    owners = dict(trace_owners or {})
+    for trace in traces:
+        owners[trace.trace_id] = (trace.org_id, trace.agent_id)
+    deltas = {}
+
+    for span in spans:
+        owner = owners.get(span.trace_id)
+        if owner is None:
+            continue
+        key = (*owner, minute_bucket(span.start_timestamp), span.kind, span.model_name or "")
+        row = deltas.get(key)
+        if row is None:
+            row = deltas[key] = dict.fromkeys(LATENCY_COUNTERS, 0)
+            row["duration_hist"] = [0] * len(LATENCY_BOUNDS)
+        row["span_count"] += 1
+        row["duration_sum_ms"] += span.duration_ms
+        row["duration_hist"][latency_bucket(span.duration_ms)] += 1
+
+    return [
+        {"org_id": org_id, "agent_id": agent_id, "bucket": bucket, "kind": kind, "model_name": model_name, **row}
+        for (org_id, agent_id, bucket, kind, model_name), row in sorted(deltas.items())
+    ]
+
+
+def upsert_latency_rollups(rows: Optional[List[Dict]] = None):
+    """Build an INSERT .. ON CONFLICT statement that adds latency histogram deltas."""
+    stmt = insert(LatencyRollup)
+    if rows is not None:
+        stmt = stmt.values(rows)
+    set_ = {name: getattr(LatencyRollup, name) + getattr(stmt.excluded, name) for name in LATENCY_COUNTERS}
+    set_["duration_hist"] = merged_histogram("latency_rollups", "duration_hist")
+    return stmt.on_conflict_do_update(
+        index_elements=[
+            LatencyRollup.org_id, LatencyRollup.bucket, LatencyRollup.agent_id,
+            LatencyRollup.kind, LatencyRollup.model_name
+        ],
+        set_=set_
+    )
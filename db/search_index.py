@@ -0,0 +1,53 @@
+"""Trigram span search, indexed off the telemetry write path.
+
+/api/graph/search matches fragments of span and trace ids, model names
+and excerpts with pg_trgm. Keeping a trigram GIN index up to date costs
+more than the rest of a span insert put together, so telemetry_spans has
+none. Instead, writers execute ``queue_span_search`` in the transaction
+that stores the spans, which only appends their search documents to
+span_search_queue. An indexer (api-mock runs one) then executes
+``index_queued_spans`` in a loop, moving the documents into span_search,
+which is partitioned by day like telemetry_spans and carries the GIN
+index. Spans become searchable once the indexer has caught up, normally
+within a second of being written.
+"""
+from typing import Iterable
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from models import SpanSearchQueue, TelemetrySpan
+
+# Moves a batch of the queue, skipping rows another indexer has locked
+INDEX_QUEUED_SPANS_SQL = """
+    WITH queued AS (
+        DELETE FROM span_search_queue
+        WHERE ctid = ANY(ARRAY(SELECT ctid FROM span_search_queue LIMIT :limit FOR UPDATE SKIP LOCKED))
+        RETURNING span_id, start_timestamp, document
+    )
+    INSERT INTO span_search (span_id, start_timestamp, document)
+    SELECT span_id, start_timestamp, document FROM queued
+"""
+
+
+def span_search_document(span: TelemetrySpan) -> str:
+    """The text a span is searched by: its ids, model name and excerpt."""
+    return f"{span.span_id} {span.trace_id} {span.model_name or ''} {span.excerpts or ''}"
+
+
+def queue_span_search(spans: Iterable[TelemetrySpan]):
+    """Build an INSERT that queues newly written spans for the search indexer."""
+    return insert(SpanSearchQueue).values([
+        {"span_id": span.span_id, "start_timestamp": span.start_timestamp, "document": span_search_document(span)}
+        for span in spans
+    ])
+
+
+def index_queued_spans(limit: int):
+    """Build a statement that moves up to ``limit`` queued spans into span_search.
+
+    Its rowcount is the number moved, and the queue is drained once a
+    batch comes back short. Commit after each batch so the queue rows stay
+    locked only briefly.
+    """
+    return text(INDEX_QUEUED_SPANS_SQL).bindparams(limit=limit)
@@ -18,6 +18,11 @@ from models import (
     CostAggregate, PolicyAudit, AgentRegistry,
     SpanKind, Protocol, SpanStatus, AnomalyType
 )
+from rollups import (
+    edge_rollup_rows, kpi_rollup_rows, latency_rollup_rows,
+    upsert_edge_rollups, upsert_kpi_rollups, upsert_latency_rollups
+)
+from search_index import queue_span_search
 
 
 class SeedGenerator:
@@ -62,6 +67,21 @@ class SeedGenerator:
             self.session.add(edge)
         self.session.flush()
 
+        # Fold the new traces, spans and edges into the rollup tables
+        rollup_rows = kpi_rollup_rows(self.traces, self.spans)
+        if rollup_rows:
+            self.session.execute(upsert_kpi_rollups(rollup_rows))
+        org_by_trace = {t.trace_id: t.org_id for t in self.traces}
+        edge_rows = edge_rollup_rows(self.edges, self.spans, org_by_trace)
+        if edge_rows:
+            self.session.execute(upsert_edge_rollups(edge_rows))
+        latency_rows = latency_rollup_rows(self.traces, self.spans)
+        if latency_rows:
+            self.session.execute(upsert_latency_rollups(latency_rows))
+        # and queue the spans for the search indexer
+        if self.spans:
+            self.session.execute(queue_span_search(self.spans))
+
         # Step 3: Generate anomalies
         print("⚠️  Generating anomalies...")
         self.generate_anomalies()
@@ -209,7 +229,7 @@ class SeedGenerator:
             trace_spans.append(span)
 
             # Create edge between agents
-            edge = self.create_edge(
+            self.create_edge(
                 trace_id=trace.trace_id,
                 from_agent=prev_agent,
                 to_agent=agent,
@@ -217,7 +237,6 @@ class SeedGenerator:
                 to_span=span,
                 timestamp=current_time
             )
-            self.edges.append(edge)
 
             current_time = span.end_timestamp
             parent_span = span
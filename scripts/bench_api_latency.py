@@ -0,0 +1,150 @@
+"""Concurrent load benchmark for the AgentOS mock HTTP services.
+
+Drives a running service with a fixed number of concurrent clients and
+reports throughput plus latency percentiles per path. Run it once against
+a build that uses synchronous sessions and once against the async data
+layer to compare p99 under the same concurrency.
+
+With ``--export-clients`` the run also keeps that many streaming exports
+open for its whole duration, each read at ``--export-read-bytes`` per
+second like a slow download, to check that they do not starve the other
+endpoints of database connections.
+
+Usage:
+    python scripts/bench_api_latency.py --url http://localhost:8004 \
+        --path "/api/traces?limit=500" --path /api/kpi/overview --path /healthz \
+        --concurrency 64 --requests 4000
+    python scripts/bench_api_latency.py --path "/api/traces?limit=100" \
+        --export-clients 8 --export-path /api/export/spans
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from typing import Dict, List, Tuple
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def timed_get(url: str) -> Tuple[float, int]:
+    """GET a URL and return (latency_ms, status)."""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    return (time.perf_counter() - start) * 1000, status
+
+
+def slow_read(url: str, bytes_per_s: int, stop: threading.Event, totals: Dict[str, int]):
+    """Download a URL at a throttled rate until it ends or ``stop`` is set, then start over."""
+    chunk = max(1, bytes_per_s // 10)
+    while not stop.is_set():
+        try:
+            with urllib.request.urlopen(url, timeout=60) as response:
+                while not stop.is_set():
+                    data = response.read(chunk)
+                    if not data:
+                        totals["completed"] += 1
+                        break
+                    totals["bytes"] += len(data)
+                    time.sleep(0.1)
+        except (OSError, http.client.HTTPException):
+            # Includes a stream cut short by a server-side error
+            totals["errors"] += 1
+            time.sleep(0.1)
+
+
+def run(base_url: str, paths: List[str], concurrency: int, total: int, warmup: int,
+        export_path: str = "", export_clients: int = 0, export_read_bytes: int = 0) -> Dict:
+    urls = [base_url.rstrip("/") + path for path in paths]
+
+    stop = threading.Event()
+    exports = {"completed": 0, "errors": 0, "bytes": 0}
+    readers = [
+        threading.Thread(target=slow_read, args=(base_url.rstrip("/") + export_path, export_read_bytes, stop, exports))
+        for _ in range(export_clients)
+    ]
+    for reader in readers:
+        reader.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed_get, [url for url, _ in zip(cycle(urls), range(warmup))]))
+
+            planned = [url for url, _ in zip(cycle(urls), range(total))]
+            started = time.perf_counter()
+            results = list(pool.map(timed_get, planned))
+            elapsed = time.perf_counter() - started
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for url, (latency_ms, status) in zip(planned, results):
+        latencies[url].append(latency_ms)
+        if status != 200:
+            errors[url] += 1
+
+    report = {
+        "concurrency": concurrency,
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "paths": {},
+    }
+    if export_clients:
+        report["exports"] = {"clients": export_clients, "path": export_path, **exports}
+    for url in urls:
+        values = sorted(latencies[url])
+        report["paths"][url[len(base_url.rstrip("/")):]] = {
+            "count": len(values),
+            "errors": errors[url],
+            "p50_ms": round(percentile(values, 0.50), 2),
+            "p95_ms": round(percentile(values, 0.95), 2),
+            "p99_ms": round(percentile(values, 0.99), 2),
+            "max_ms": round(values[-1], 2) if values else 0.0,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8004")
+    parser.add_argument("--path", action="append", dest="paths",
+                        help="Request path, may be repeated; requests round-robin across paths")
+    parser.add_argument("--concurrency", "-c", type=int, default=32)
+    parser.add_argument("--requests", "-n", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--export-path", default="/api/export/spans")
+    parser.add_argument("--export-clients", type=int, default=0,
+                        help="Slow streaming exports kept open alongside the run")
+    parser.add_argument("--export-read-bytes", type=int, default=16384, help="Read rate of each export, bytes/sec")
+    args = parser.parse_args()
+
+    paths = args.paths or ["/api/traces?limit=100", "/api/kpi/overview", "/healthz"]
+    print(json.dumps(run(
+        args.url, paths, args.concurrency, args.requests, args.warmup,
+        args.export_path, args.export_clients, args.export_read_bytes
+    ), indent=2))
+
+
+if __name__ == "__main__":
+    main()
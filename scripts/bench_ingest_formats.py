@@ -0,0 +1,177 @@
+"""CPU cost of decoding ingest request bodies, per format and compression.
+
+Builds the same synthetic traces and spans (see bench_ingest.py) as a JSON
+event list, a msgpack event list and an OTLP ExportTraceServiceRequest,
+each plain, gzip and zstd compressed where the endpoint accepts it, and
+times how long the ingest service's decoders take to turn each body into
+row tuples. ``json`` is the /api/telemetry/events path: JSON parsing plus
+Pydantic validation of every TelemetryEvent. Reports CPU milliseconds and
+body bytes per 10k rows decoded; database writes are left out.
+
+Usage:
+    python scripts/bench_ingest_formats.py --events 10000 --repeat 20
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'db'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'observability', 'ingest-mock'))
+
+import msgpack
+import zstandard
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.proto.common.v1.common_pb2 import AnyValue, KeyValue
+from opentelemetry.proto.trace.v1.trace_pb2 import Status
+from pydantic import TypeAdapter
+
+from app import TelemetryEvent
+from batch_writer import decode_events
+from bench_ingest import trace_events
+from formats import DECODERS, OTLP_ATTRIBUTES, decompress
+
+MAX_BODY_BYTES = 1 << 30
+TIMESTAMP_FIELDS = ("start_timestamp", "end_timestamp", "timestamp")
+
+
+def make_events(count: int, spans_per_trace: int) -> List[Dict]:
+    """Trace and span events; OTLP has no edges, so they are left out of every format."""
+    events: List[Dict] = []
+    while len(events) < count:
+        start = datetime.utcnow()
+        events.extend(e for e in trace_events(spans_per_trace, start) if e["event_type"] != "edge")
+    return events
+
+
+def msgpack_body(events: List[Dict]) -> bytes:
+    """The event list with native msgpack timestamps, as a binary producer would send it."""
+    packed = []
+    for event in events:
+        data = dict(event["data"])
+        for name in TIMESTAMP_FIELDS:
+            if data.get(name):
+                data[name] = datetime.fromisoformat(data[name]).replace(tzinfo=timezone.utc)
+        packed.append({**event, "data": data})
+    return msgpack.packb(packed, datetime=True)
+
+
+def key_value(key: str, value) -> KeyValue:
+    if isinstance(value, bool):
+        return KeyValue(key=key, value=AnyValue(bool_value=value))
+    if isinstance(value, int):
+        return KeyValue(key=key, value=AnyValue(int_value=value))
+    return KeyValue(key=key, value=AnyValue(string_value=str(value)))
+
+
+def nanos(value: str) -> int:
+    return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp() * 1_000_000) * 1000
+
+
+def otlp_body(events: List[Dict]) -> bytes:
+    """Each trace event as a root span under its agent's resource, with its spans as children."""
+    request = ExportTraceServiceRequest()
+    scopes = {}
+    span_ids: Dict[str, bytes] = {}
+    root_ids: Dict[str, bytes] = {}
+    trace_ids: Dict[str, bytes] = {}
+    for event in events:
+        data = event["data"]
+        trace_id = trace_ids.setdefault(event["trace_id"], uuid.uuid4().bytes)
+        if event["event_type"] == "trace":
+            if data["agent_id"] not in scopes:
+                resource_spans = request.resource_spans.add()
+                resource_spans.resource.attributes.extend(
+                    key_value(OTLP_ATTRIBUTES[name], data[name])
+                    for name in ("org_id", "project_id", "agent_id", "version_id")
+                )
+                scopes[data["agent_id"]] = resource_spans.scope_spans.add()
+            span = scopes[data["agent_id"]].spans.add()
+            span.span_id = root_ids[event["trace_id"]] = uuid.uuid4().bytes[:8]
+            span.name = "invoke"
+            span.attributes.extend(
+                key_value(OTLP_ATTRIBUTES[name], data[name])
+                for name in ("invocation_id", "protocol", "signature_verified", "cost_cents")
+            )
+            agent_scope = scopes[data["agent_id"]]
+        else:
+            span = agent_scope.spans.add()
+            span.span_id = span_ids.setdefault(data["span_id"], uuid.uuid4().bytes[:8])
+            parent = data["parent_span_id"]
+            span.parent_span_id = span_ids[parent] if parent else root_ids[event["trace_id"]]
+            span.name = data["kind"]
+            span.attributes.extend(
+                key_value(OTLP_ATTRIBUTES[name], data[name])
+                for name in ("kind", "model_provider", "model_name", "tokens_in", "tokens_out", "signature_verified")
+                if data[name] is not None
+            )
+            if data["status"] == "error":
+                span.status.code = Status.STATUS_CODE_ERROR
+        span.trace_id = trace_id
+        span.start_time_unix_nano = nanos(data["start_timestamp"])
+        span.end_time_unix_nano = nanos(data["end_timestamp"])
+    return request.SerializeToString()
+
+
+def decode_json_endpoint(body: bytes):
+    """What FastAPI does for /api/telemetry/events before the handler, then the handler's decode."""
+    events = TypeAdapter(List[TelemetryEvent]).validate_python(json.loads(body))
+    return decode_events((e.event_type, e.trace_id, e.data) for e in events)
+
+
+def binary_decoder(fmt: str, encoding: str) -> Callable:
+    decode = DECODERS[fmt]
+    return lambda body: decode(decompress(body, encoding, MAX_BODY_BYTES))
+
+
+def measure(decode: Callable, body: bytes, repeat: int) -> Dict:
+    """Best of ``repeat`` decodes, which is the least disturbed by everything else on the machine."""
+    rows = len(decode(body))
+    cpu = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        decode(body)
+        cpu = min(cpu, time.process_time() - started)
+    return {
+        "rows": rows,
+        "bytes_per_10k_rows": round(len(body) * 10000 / rows),
+        "cpu_ms_per_10k_rows": round(cpu * 1000 * 10000 / rows, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=10000, help="Trace and span events per body")
+    parser.add_argument("--spans", type=int, default=6, help="Spans per generated trace")
+    parser.add_argument("--repeat", "-n", type=int, default=20)
+    args = parser.parse_args()
+
+    events = make_events(args.events, args.spans)
+    json_body = json.dumps(events).encode()
+    bodies = {"msgpack": msgpack_body(events), "otlp": otlp_body(events)}
+    compress = {
+        "identity": lambda body: body,
+        "gzip": lambda body: gzip.compress(body, compresslevel=6),
+        "zstd": lambda body: zstandard.ZstdCompressor(level=3).compress(body),
+    }
+
+    variants = [("json", decode_json_endpoint, json_body), ("json-rows", DECODERS["json"], json_body)]
+    for fmt, body in bodies.items():
+        for encoding, encode in compress.items():
+            name = fmt if encoding == "identity" else f"{fmt}+{encoding}"
+            variants.append((name, binary_decoder(fmt, encoding), encode(body)))
+
+    report = {name: measure(decode, body, args.repeat) for name, decode, body in variants}
+    baseline = report["json"]["cpu_ms_per_10k_rows"]
+    for result in report.values():
+        result["speedup"] = round(baseline / result["cpu_ms_per_10k_rows"], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Rows/sec benchmark for the api-mock list endpoints' serialization paths.
+
+Requests the same large pages with the default model-based serializer and
+with the column-tuple fast path (``fast=true``, optionally with a
+``fields=`` projection) and reports rows per second, latency and payload
+size for each variant.
+
+Usage:
+    python scripts/bench_serialization.py --url http://localhost:8004 \
+        --path "/api/spans?limit=1000" --path "/api/edges?limit=1000" --requests 200
+"""
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from bench_api_latency import percentile
+
+
+def fetch(url: str) -> Dict:
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=60) as response:
+        body = response.read()
+    return {"latency_ms": (time.perf_counter() - start) * 1000, "bytes": len(body), "rows": len(json.loads(body))}
+
+
+def run_variant(url: str, total: int, concurrency: int, warmup: int) -> Dict:
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(fetch, [url] * warmup))
+        started = time.perf_counter()
+        results = list(pool.map(fetch, [url] * total))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(r["latency_ms"] for r in results)
+    rows = sum(r["rows"] for r in results)
+    return {
+        "rows_per_response": results[0]["rows"] if results else 0,
+        "bytes_per_response": results[0]["bytes"] if results else 0,
+        "rows_per_s": round(rows / elapsed),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8004")
+    parser.add_argument("--path", action="append", dest="paths",
+                        help="List request to benchmark, may be repeated")
+    parser.add_argument("--fields", help="Also benchmark this fields= projection")
+    parser.add_argument("--concurrency", "-c", type=int, default=1)
+    parser.add_argument("--requests", "-n", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10)
+    args = parser.parse_args()
+
+    report: Dict[str, Dict] = {}
+    for path in args.paths or ["/api/spans?limit=1000", "/api/edges?limit=1000", "/api/traces?limit=500"]:
+        base = args.url.rstrip("/") + path
+        separator = "&" if "?" in base else "?"
+        variants: List = [("default", base), ("fast", base + separator + "fast=true")]
+        if args.fields:
+            variants.append(("fields", base + separator + "fields=" + args.fields))
+
+        report[path] = {name: run_variant(url, args.requests, args.concurrency, args.warmup) for name, url in variants}
+        baseline = report[path]["default"]["rows_per_s"]
+        for name, _ in variants[1:]:
+            report[path][name]["speedup"] = round(report[path][name]["rows_per_s"] / baseline, 2) if baseline else None
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
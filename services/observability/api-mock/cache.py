@@ -0,0 +1,61 @@
+"""Small in-process cache for completed-trace responses."""
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Hashable, NamedTuple, Optional
+
+
+class CachedBody(NamedTuple):
+    etag: str
+    body: bytes
+    expires: float
+
+
+class ResponseCache:
+    """LRU of serialized response bodies and their strong ETags, bounded by total bytes.
+
+    Entries expire ``ttl`` seconds after they are stored, so a body goes
+    stale for at most that long when late telemetry changes it.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size_bytes = 0
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def etag_for(body: bytes) -> str:
+        return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic():
+                del self._entries[key]
+                self.size_bytes -= len(entry.body)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, body: bytes) -> CachedBody:
+        entry = CachedBody(self.etag_for(body), body, time.monotonic() + self.ttl)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= len(previous.body)
+            self._entries[key] = entry
+            self.size_bytes += len(body)
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted.body)
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,107 @@
+"""In-process fan-out of live telemetry events to streaming subscribers.
+
+A single LISTEN connection per process receives the notifications writers
+send (see notifications.py) and copies each event into the bounded queue
+of every matching subscriber. A subscriber whose queue is full is dropped
+instead of buffering without limit or slowing the others down; clients
+are expected to reconnect and backfill from the list endpoints.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, FrozenSet, Optional, Set
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    def __init__(self, buffer_size: int, org_id: Optional[str], agent_id: Optional[str], types: FrozenSet[str]):
+        self.queue: "asyncio.Queue[Dict]" = asyncio.Queue(buffer_size)
+        self.org_id = org_id
+        self.agent_id = agent_id
+        self.types = types
+        self.dropped = False
+
+    def matches(self, event: Dict) -> bool:
+        return (
+            event.get("type") in self.types
+            and (self.org_id is None or event.get("org_id") == self.org_id)
+            and (self.agent_id is None or event.get("agent_id") == self.agent_id)
+        )
+
+
+class LiveFeed:
+    """One Postgres LISTEN connection shared by every subscriber in the process."""
+
+    def __init__(self, dsn: str, channel: str, buffer_size: int):
+        self.dsn = dsn
+        self.channel = channel
+        self.buffer_size = buffer_size
+        self.subscribers: Set[Subscriber] = set()
+        self.published = 0
+        self.dropped_subscribers = 0
+        self._listener: Optional[asyncio.Task] = None
+
+    def subscribe(self, org_id: Optional[str], agent_id: Optional[str], types: FrozenSet[str]) -> Subscriber:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        subscriber = Subscriber(self.buffer_size, org_id, agent_id, types)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def close(self):
+        """Stop listening, closing the LISTEN connection; a later subscribe starts it again."""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.cancel()
+            try:
+                await listener
+            except asyncio.CancelledError:
+                pass
+
+    def publish(self, event: Dict):
+        """Queue an event for every matching subscriber, dropping any that are full."""
+        self.published += 1
+        for subscriber in list(self.subscribers):
+            if not subscriber.matches(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber.dropped = True
+                self.subscribers.discard(subscriber)
+                self.dropped_subscribers += 1
+
+    def _on_notification(self, connection, pid, channel, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed live event: %.200s", payload)
+            return
+        self.publish(event)
+
+    async def _listen(self):
+        """Hold the LISTEN connection open, reconnecting with backoff when it drops."""
+        delay = 1
+        while True:
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                try:
+                    closed = asyncio.get_running_loop().create_future()
+                    connection.add_termination_listener(lambda _: closed.done() or closed.set_result(None))
+                    await connection.add_listener(self.channel, self._on_notification)
+                    delay = 1
+                    await closed
+                finally:
+                    await connection.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Live feed connection failed, retrying in %ss", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
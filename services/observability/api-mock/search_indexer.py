@@ -0,0 +1,63 @@
+"""Background indexer that makes newly written spans searchable.
+
+Writers only queue the search documents of the spans they store (see
+search_index.py); this task drains that queue into span_search every
+``interval`` seconds, ``batch_size`` spans per transaction. Several
+processes can run it at once: each batch skips queue rows another indexer
+holds.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from search_index import index_queued_spans
+
+logger = logging.getLogger(__name__)
+
+
+class SearchIndexer:
+    def __init__(self, session_factory, interval: float, batch_size: int):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.indexed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """Stop indexing; whatever is still queued is picked up after a restart."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def drain(self) -> int:
+        """Index queued spans until the queue is empty, returning how many were indexed."""
+        indexed = 0
+        session = self.session_factory()
+        try:
+            while True:
+                moved = (await session.execute(index_queued_spans(self.batch_size))).rowcount
+                await session.commit()
+                indexed += moved
+                self.indexed += moved
+                if moved < self.batch_size:
+                    return indexed
+        finally:
+            await session.close()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Search indexing failed, retrying in %ss", self.interval)
+            await asyncio.sleep(self.interval)
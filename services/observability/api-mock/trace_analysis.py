@@ -0,0 +1,247 @@
+"""Span tree construction, latency breakdown and path analysis for a single trace.
+
+Everything here works on already-loaded span and edge rows and runs in
+linear time (plus one sort), without recursion, so traces with thousands
+of spans or very deep call chains are safe to analyze in-process.
+"""
+import heapq
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models import TelemetryEdge, TelemetrySpan
+
+
+def build_span_tree(spans: Iterable[TelemetrySpan]) -> Tuple[List[TelemetrySpan], List[str], Dict[str, List[str]]]:
+    """Link spans to their children in one pass over the start-ordered list.
+
+    Returns the ordered spans, the root span ids and a span_id -> child ids
+    map. A span whose parent is missing from the trace is treated as a root.
+    Parent links that loop (a span that is its own parent, or x -> y -> x)
+    are cut at the earliest-starting span of the loop, which becomes a root,
+    so every span is reachable from exactly one root.
+    """
+    ordered = sorted(spans, key=lambda s: (s.start_timestamp, s.span_id))
+    children: Dict[str, List[str]] = {s.span_id: [] for s in ordered}
+    roots = set()
+    for span in ordered:
+        if span.parent_span_id in children:
+            children[span.parent_span_id].append(span.span_id)
+        else:
+            roots.add(span.span_id)
+
+    reached = set(descendants(roots, children))
+    if len(reached) < len(ordered):
+        by_id = {s.span_id: s for s in ordered}
+        position = {s.span_id: i for i, s in enumerate(ordered)}
+        for span in ordered:
+            if span.span_id in reached:
+                continue
+            # No root above it, so following parents must come back round
+            chain: Dict[str, int] = {}
+            current = span.span_id
+            while current not in chain:
+                chain[current] = len(chain)
+                current = by_id[current].parent_span_id
+            cut = min(list(chain)[chain[current]:], key=position.__getitem__)
+            children[by_id[cut].parent_span_id].remove(cut)
+            roots.add(cut)
+            reached.update(descendants([cut], children))
+
+    return ordered, [s.span_id for s in ordered if s.span_id in roots], children
+
+
+def descendants(span_ids: Iterable[str], children: Dict[str, List[str]]) -> Iterable[str]:
+    """The given spans and everything below them, each once for a tree."""
+    stack = list(span_ids)
+    while stack:
+        span_id = stack.pop()
+        yield span_id
+        stack.extend(children[span_id])
+
+
+def covered_ms(start: datetime, end: datetime, intervals: List[Tuple[datetime, datetime]]) -> int:
+    """Milliseconds of [start, end] covered by the union of start-sorted intervals."""
+    covered = 0.0
+    cursor = start
+    for child_start, child_end in intervals:
+        child_start = max(child_start, cursor)
+        child_end = min(child_end, end)
+        if child_end > child_start:
+            covered += (child_end - child_start).total_seconds() * 1000
+            cursor = child_end
+    return int(covered)
+
+
+def analyze_trace(
+    trace_agent_id: str,
+    spans: Iterable[TelemetrySpan],
+    edges: Iterable[TelemetryEdge]
+) -> Dict:
+    """Compute per-span self/child time, the critical path and per-agent/model totals.
+
+    Child time is the union of the children's intervals clipped to the
+    parent, so parallel children are not double counted. A span belongs to
+    the agent that received the nearest edge into it or one of its
+    ancestors, falling back to the trace's agent. The critical path starts
+    at the latest-finishing root and repeatedly descends into the child that
+    finishes last, i.e. the chain the trace's end time was waiting on.
+    """
+    ordered, roots, children = build_span_tree(spans)
+    by_id = {s.span_id: s for s in ordered}
+    edge_agent = {e.to_span_id: e.to_agent_id for e in edges}
+
+    timings: Dict[str, Dict] = {}
+    queue = deque((root_id, 0, trace_agent_id) for root_id in roots)
+    while queue:
+        span_id, depth, inherited_agent = queue.popleft()
+        span = by_id[span_id]
+        agent_id = edge_agent.get(span_id, inherited_agent)
+
+        child_spans = [by_id[c] for c in children[span_id]]
+        child_time = min(
+            span.duration_ms,
+            covered_ms(span.start_timestamp, span.end_timestamp,
+                       [(c.start_timestamp, c.end_timestamp) for c in child_spans])
+        )
+        timings[span_id] = {
+            "span_id": span_id,
+            "parent_span_id": span.parent_span_id,
+            "depth": depth,
+            "agent_id": agent_id,
+            "kind": span.kind.value,
+            "model_provider": span.model_provider,
+            "model_name": span.model_name,
+            "duration_ms": span.duration_ms,
+            "self_time_ms": span.duration_ms - child_time,
+            "child_time_ms": child_time,
+        }
+        queue.extend((c.span_id, depth + 1, agent_id) for c in child_spans)
+
+    critical_path: List[str] = []
+    current: Optional[str] = max(roots, key=lambda r: by_id[r].end_timestamp, default=None)
+    while current is not None:
+        critical_path.append(current)
+        current = max(children[current], key=lambda c: by_id[c].end_timestamp, default=None)
+
+    by_agent: Dict[str, Dict] = {}
+    by_model: Dict[Tuple[Optional[str], Optional[str]], Dict] = {}
+    for span in ordered:
+        timing = timings[span.span_id]
+        agent = by_agent.setdefault(timing["agent_id"], {
+            "agent_id": timing["agent_id"], "span_count": 0, "self_time_ms": 0, "duration_ms": 0
+        })
+        agent["span_count"] += 1
+        agent["self_time_ms"] += timing["self_time_ms"]
+        agent["duration_ms"] += span.duration_ms
+
+        model = by_model.setdefault((span.model_provider, span.model_name), {
+            "model_provider": span.model_provider, "model_name": span.model_name,
+            "span_count": 0, "self_time_ms": 0, "duration_ms": 0, "tokens_in": 0, "tokens_out": 0
+        })
+        model["span_count"] += 1
+        model["self_time_ms"] += timing["self_time_ms"]
+        model["duration_ms"] += span.duration_ms
+        model["tokens_in"] += span.tokens_in or 0
+        model["tokens_out"] += span.tokens_out or 0
+
+    return {
+        "root_span_ids": roots,
+        "spans": [timings[s.span_id] for s in ordered],
+        "critical_path": {
+            "span_ids": critical_path,
+            "self_time_ms": sum(timings[s]["self_time_ms"] for s in critical_path),
+        },
+        "by_agent": sorted(by_agent.values(), key=lambda a: -a["self_time_ms"]),
+        "by_model": sorted(by_model.values(), key=lambda m: -m["self_time_ms"]),
+    }
+
+
+def analyze_paths(spans: Iterable[TelemetrySpan], edges: Iterable[TelemetryEdge], k: int) -> Dict:
+    """Compute self time, fan-in/fan-out and the k slowest paths of the span DAG.
+
+    The DAG links every span to its children and follows each edge from
+    from_span_id to to_span_id; an edge that duplicates a parent link is
+    merged into it. A path runs from a span with no predecessors to one with
+    no successors, and its latency is the sum of its spans' self time, so
+    nested work is not counted twice. Spans are visited once in topological
+    order, keeping the k best partial paths into each, which makes the pass
+    O((V + E) * k log k). Spans on a cycle, which well-formed telemetry never
+    contains, are left out of the paths. Ties are broken by span start
+    order, so the result is deterministic.
+    """
+    ordered, _, children = build_span_tree(spans)
+    by_id = {s.span_id: s for s in ordered}
+    position = {s.span_id: i for i, s in enumerate(ordered)}
+
+    # span_id -> {successor span_id: edge_id, or None for a parent link}
+    successors: Dict[str, Dict[str, Optional[str]]] = {
+        span_id: dict.fromkeys(child_ids) for span_id, child_ids in children.items()
+    }
+    for edge in sorted(edges, key=lambda e: (e.timestamp, e.edge_id)):
+        if edge.from_span_id in by_id and edge.to_span_id in by_id and edge.from_span_id != edge.to_span_id:
+            if successors[edge.from_span_id].get(edge.to_span_id) is None:
+                successors[edge.from_span_id][edge.to_span_id] = edge.edge_id
+    predecessors: Dict[str, List[str]] = {span_id: [] for span_id in by_id}
+    for span_id in by_id:
+        for successor in successors[span_id]:
+            predecessors[successor].append(span_id)
+
+    self_time = {}
+    for span in ordered:
+        child_time = covered_ms(span.start_timestamp, span.end_timestamp,
+                                [(by_id[c].start_timestamp, by_id[c].end_timestamp) for c in children[span.span_id]])
+        self_time[span.span_id] = span.duration_ms - min(span.duration_ms, child_time)
+
+    # best[span_id]: up to k (latency, predecessor, predecessor's rank) entries,
+    # slowest first; rank i refers to best[predecessor][i].
+    def rank_key(entry):
+        latency, predecessor, rank = entry
+        return latency, -position.get(predecessor, -1), -rank
+
+    best: Dict[str, List[Tuple[int, Optional[str], int]]] = {}
+    indegree = {span_id: len(p) for span_id, p in predecessors.items()}
+    queue = deque(s.span_id for s in ordered if indegree[s.span_id] == 0)
+    endings = []
+    while queue:
+        span_id = queue.popleft()
+        weight = self_time[span_id]
+        if predecessors[span_id]:
+            candidates = [
+                (latency + weight, predecessor, rank)
+                for predecessor in predecessors[span_id]
+                for rank, (latency, _, _) in enumerate(best[predecessor])
+            ]
+        else:
+            candidates = [(weight, None, 0)]
+        best[span_id] = heapq.nlargest(k, candidates, key=rank_key)
+
+        if not successors[span_id]:
+            endings.extend((latency, span_id, rank) for rank, (latency, _, _) in enumerate(best[span_id]))
+        for successor in successors[span_id]:
+            indegree[successor] -= 1
+            if indegree[successor] == 0:
+                queue.append(successor)
+
+    paths = []
+    for latency, span_id, rank in heapq.nlargest(k, endings, key=rank_key):
+        span_ids: List[str] = []
+        current: Optional[str] = span_id
+        while current is not None:
+            span_ids.append(current)
+            _, current, rank = best[current][rank]
+        span_ids.reverse()
+        paths.append({
+            "span_ids": span_ids,
+            "edge_ids": [
+                successors[a][b] for a, b in zip(span_ids, span_ids[1:]) if successors[a][b] is not None
+            ],
+            "latency_ms": latency,
+        })
+
+    return {
+        "self_time_ms": self_time,
+        "fan_in": {span_id: len(p) for span_id, p in predecessors.items()},
+        "fan_out": {span_id: len(s) for span_id, s in successors.items()},
+        "paths": paths,
+    }
@@ -1,11 +1,109 @@
 """Telemetry Ingest Mock - ATP event ingestion."""
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import Dict, Any, Tuple
+import gc
+import logging
 import os
+import sys
+import time
 
-app = FastAPI(title="Telemetry Ingest Mock", version="0.1.0")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', '..', 'db'))
+
+from anomaly_detection import AnomalyDetector
+from database import Session
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceResponse
+
+from batch_writer import Batch, InvalidEvent, WriteStats, write_batch
+from dedup import Deduplicator
+from formats import DECODERS, BodyTooLarge, InvalidBody, UnsupportedEncoding, decode_wal_record, decompress, wal_record
+from ingest_queue import BatchTooLarge, IngestQueue, QueueFull
+from wal import WalError, WriteAheadLog
+
+logger = logging.getLogger(__name__)
+
+
+# Ids written recently, so retried rows are dropped cheaply; see dedup.py
+dedup = Deduplicator(
+    capacity=int(os.getenv("INGEST_DEDUP_CAPACITY", "1000000")),
+    error_rate=float(os.getenv("INGEST_DEDUP_ERROR_RATE", "0.01"))
+)
+
+# Scores every batch as it is written, like the runtime does its own
+# traces; INGEST_DETECT_ANOMALIES=false leaves detection to the producers
+detector = AnomalyDetector() if os.getenv("INGEST_DETECT_ANOMALIES", "true").lower() == "true" else None
+
+# Rows written ahead of their trace, and anomalies detected
+write_stats = WriteStats()
+
+
+async def write_events(batch: Batch):
+    session = Session()
+    try:
+        await write_batch(session, batch, dedup, detector, write_stats)
+    finally:
+        await session.close()
+
+
+# Requests are acknowledged once they are in the write-ahead log on local
+# disk and queued; one worker writes them in merged batches of up to
+# INGEST_FLUSH_EVENTS rows, or every INGEST_FLUSH_MS, and the log keeps
+# them until they are committed, across database outages and restarts.
+wal = WriteAheadLog(
+    os.getenv("INGEST_WAL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "wal")),
+    segment_bytes=int(os.getenv("INGEST_WAL_SEGMENT_MB", "64")) * 1024 * 1024,
+    fsync=os.getenv("INGEST_WAL_FSYNC", "true").lower() == "true"
+)
+ingest_queue = IngestQueue(
+    write_events,
+    max_events=int(os.getenv("INGEST_QUEUE_MAX_EVENTS", "100000")),
+    flush_events=int(os.getenv("INGEST_FLUSH_EVENTS", "5000")),
+    flush_interval=int(os.getenv("INGEST_FLUSH_MS", "50")) / 1000,
+    on_done=wal.done
+)
+
+# Allocations between collections of the youngest GC generation
+INGEST_GC_THRESHOLD = int(os.getenv("INGEST_GC_THRESHOLD", "50000"))
+
+# Largest request body accepted once inflated, whatever its Content-Encoding
+MAX_BODY_BYTES = int(os.getenv("INGEST_MAX_BODY_MB", "64")) * 1024 * 1024
+
+
+def replay_wal():
+    """Queue the logged requests a previous run accepted but did not get to write."""
+    for seq, payload in wal.open():
+        try:
+            batch = decode_wal_record(payload, MAX_BODY_BYTES)
+        except (KeyError, TypeError, ValueError):
+            logger.exception("Moving undecodable write-ahead log record %d to the dead-letter file", seq)
+            try:
+                wal.dead_letter(seq, payload)
+            except OSError:
+                logger.exception("Could not dead-letter write-ahead log record %d, keeping it in the log", seq)
+            continue
+        ingest_queue.put(batch, seq, force=True)
+    if wal.replayed:
+        logger.warning("Replaying %d ingest requests from the write-ahead log", wal.replayed)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    replay_wal()
+    # Every batch allocates a tuple or dict per row, which keeps the cyclic
+    # collector busy; leave the long-lived objects loaded at startup out of
+    # its scans and let it run less often
+    gc.freeze()
+    gc.set_threshold(INGEST_GC_THRESHOLD)
+    ingest_queue.start()
+    yield
+    await ingest_queue.close()
+    wal.close()
+
+
+app = FastAPI(title="Telemetry Ingest Mock", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,14 +125,122 @@ async def health_check():
     return {"status": "healthy", "service": "ingest-mock"}
 
 
-@app.post("/api/telemetry/events")
-async def ingest_events(events: List[TelemetryEvent]):
-    """Ingest ATP telemetry events."""
-    # In production, this would process and store events
+async def accept(batch: Batch, record: bytes):
+    """Log a decoded request to the write-ahead log and queue it, or raise the HTTP error refusing it."""
+    size = len(batch)
+    try:
+        ingest_queue.reserve(size)
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    try:
+        seq = wal.append(record)
+        try:
+            await wal.sync(seq)
+        except WalError as e:
+            wal.done([seq])
+            raise HTTPException(status_code=503, detail=str(e))
+        ingest_queue.put(batch, seq, force=True)
+    finally:
+        ingest_queue.release(size)
+
+
+async def decode_body(request: Request, fmt: str) -> Tuple[Batch, bytes]:
+    """Inflate and decode a request body, returning its batch and write-ahead log record."""
+    body = await request.body()
+    encoding = request.headers.get("content-encoding")
+    try:
+        batch = DECODERS[fmt](decompress(body, encoding, MAX_BODY_BYTES))
+    except UnsupportedEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except BodyTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (InvalidBody, InvalidEvent) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return batch, wal_record(fmt, encoding, body)
+
+
+def binary_body(media_type: str) -> Dict:
+    return {"requestBody": {"required": True, "content": {media_type: {"schema": {"type": "string", "format": "binary"}}}}}
+
+
+def accepted(events: int, batch: Batch) -> Dict:
+    return {
+        "status": "accepted",
+        "events_received": events,
+        "rows_queued": batch.counts(),
+        "message": "Events queued for ingestion"
+    }
+
+
+def json_events_body() -> Dict:
+    schema = {"type": "array", "items": TelemetryEvent.model_json_schema()}
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": schema}}}}
+
+
+@app.post("/api/telemetry/events", status_code=202, openapi_extra=json_events_body())
+async def ingest_events(request: Request):
+    """Ingest ATP telemetry events, a JSON list of TelemetryEvent.
+
+    ``event_type`` is one of trace, span, edge or anomaly, and ``data``
+    holds the row's columns (enums by value, timestamps as ISO 8601). The
+    body may be gzip or zstd compressed and is decoded straight into rows,
+    like the binary formats. The whole request is decoded up front, so a
+    malformed event rejects it with 422, then appended to the write-ahead
+    log and queued: the 202 means it is on local disk, and it is written
+    with the requests around it in one COPY transaction shortly after. A
+    full queue answers 429 with Retry-After, a request larger than the
+    whole queue 413 and a failing log 503.
+    """
+    batch, record = await decode_body(request, "json")
+    await accept(batch, record)
+    return accepted(len(batch), batch)
+
+
+@app.post("/api/telemetry/events/msgpack", status_code=202, openapi_extra=binary_body("application/msgpack"))
+async def ingest_msgpack_events(request: Request):
+    """Ingest the same event list as /api/telemetry/events, msgpack encoded.
+
+    The body may be gzip or zstd compressed (Content-Encoding) and is
+    decoded straight into rows; responses are as for JSON events.
+    """
+    batch, record = await decode_body(request, "msgpack")
+    await accept(batch, record)
+    return accepted(len(batch), batch)
+
+
+@app.post("/v1/traces", openapi_extra=binary_body("application/x-protobuf"))
+async def ingest_otlp_traces(request: Request):
+    """OTLP/HTTP trace receiver: a protobuf ExportTraceServiceRequest, optionally gzip or zstd compressed.
+
+    Spans are mapped to span rows and root spans to trace rows through
+    their ``agentos.*`` attributes, so OTel SDK exporters can send here
+    directly. Accepted requests go through the same write-ahead log and
+    queue as JSON events.
+    """
+    if request.headers.get("content-type", "").startswith("application/json"):
+        raise HTTPException(status_code=415, detail="OTLP/JSON is not supported, send application/x-protobuf")
+    batch, record = await decode_body(request, "otlp")
+    await accept(batch, record)
+    return Response(content=ExportTraceServiceResponse().SerializeToString(), media_type="application/x-protobuf")
+
+
+@app.get("/api/telemetry/queue")
+async def ingest_queue_stats():
+    """Report ingest queue depth, throughput counters, flush latency, write-ahead log, dedup and write state.
+
+    ``cpu_seconds`` is the CPU time this process has used, so a benchmark
+    can tell what each event costs it apart from what the database and
+    other processes on the host use.
+    """
     return {
-        "status": "success",
-        "events_received": len(events),
-        "message": "Events ingested successfully"
+        **ingest_queue.stats(),
+        "wal": wal.stats(),
+        "dedup": dedup.stats(),
+        "writes": write_stats.stats(),
+        "cpu_seconds": round(time.process_time(), 3),
     }
 
 
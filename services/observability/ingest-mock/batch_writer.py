@@ -0,0 +1,560 @@
+"""Decoding of ingest events into table rows, and batched writes with COPY.
+
+Events are decoded into plain row tuples in column order, which
+asyncpg's binary COPY can stream straight into the partitioned telemetry
+tables. The rows keep the model attribute names, so the write-time
+rollups and live notifications are computed from them directly and never
+go through ORM objects.
+
+Spans, edges and anomalies are attributed to an org and agent through
+their trace. Rows that arrive before their trace row (out-of-order
+delivery) are stored but cannot be counted yet; their trace is recorded
+in ingest_orphan_traces and they are folded into the rollups and live
+events when the trace row is written. The counted traces and spans also
+go through the anomaly detector, and what it finds is written with them.
+Orphans whose trace never arrives stay uncounted, and a trace written by
+another process while such rows are being written can miss them.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import asyncpg
+import orjson
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+
+from anomaly_detection import AnomalyDetector
+from models import (
+    AnomalyType, IngestOrphanTrace, Protocol, SpanKind, SpanSearchQueue, SpanStatus,
+    TelemetryAnomaly, TelemetryEdge, TelemetrySpan, TelemetryTrace
+)
+from notifications import live_events, notify_live_events
+from search_index import span_search_document
+from rollups import (
+    edge_rollup_rows, kpi_rollup_rows, latency_rollup_rows,
+    upsert_edge_rollups, upsert_kpi_rollups, upsert_latency_rollups
+)
+
+
+class TraceRow(NamedTuple):
+    trace_id: str
+    invocation_id: str
+    org_id: str
+    project_id: str
+    agent_id: str
+    version_id: str
+    protocol: Protocol
+    run_mode: str
+    config_hash: Optional[str]
+    signature_verified: bool
+    cost_cents: int
+    start_timestamp: datetime
+    end_timestamp: Optional[datetime]
+
+
+class SpanRow(NamedTuple):
+    span_id: str
+    trace_id: str
+    parent_span_id: Optional[str]
+    kind: SpanKind
+    model_provider: Optional[str]
+    model_name: Optional[str]
+    model_params: Optional[Any]
+    tokens_in: int
+    tokens_out: int
+    excerpts: Optional[str]
+    policy_enforced: Optional[Any]
+    obligations: Optional[Any]
+    redaction_mask_ids: Optional[Any]
+    signature_verified: bool
+    status: SpanStatus
+    duration_ms: int
+    content_hash_in: Optional[str]
+    content_hash_out: Optional[str]
+    start_timestamp: datetime
+    end_timestamp: datetime
+
+
+class EdgeRow(NamedTuple):
+    edge_id: str
+    trace_id: str
+    from_agent_id: str
+    from_agent_version: str
+    to_agent_id: str
+    to_agent_version: str
+    from_span_id: str
+    to_span_id: str
+    channel: Protocol
+    instruction_type: Optional[str]
+    signature_verified: bool
+    size_bytes: int
+    content_hash: Optional[str]
+    timestamp: datetime
+
+
+class AnomalyRow(NamedTuple):
+    anomaly_id: str
+    trace_id: str
+    span_id: Optional[str]
+    anomaly_type: AnomalyType
+    severity: str
+    details: Optional[Any]
+    detected_at: datetime
+
+
+class TraceRef(NamedTuple):
+    """A trace written in an earlier batch, as the anomaly detector sees it: its cost was scored then."""
+    trace_id: str
+    agent_id: str
+    end_timestamp: Optional[datetime] = None
+    cost_cents: Optional[int] = None
+
+
+class InvalidEvent(ValueError):
+    """An event that cannot be decoded into a row; ``index`` is its position in the request."""
+
+    def __init__(self, index: int, message: str):
+        super().__init__(f"event {index}: {message}")
+        self.index = index
+
+
+REQUIRED = object()
+
+
+def parse_timestamp(value) -> datetime:
+    """ISO 8601 string, epoch seconds or datetime to a naive UTC datetime, as the columns store."""
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    parsed = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if parsed.tzinfo is timezone.utc:
+        return parsed.replace(tzinfo=None)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_bool(value) -> bool:
+    """A boolean, or "true"/"false" as clients that stringify attributes send it; anything else is an error."""
+    if value is True or value is False:
+        return value
+    if isinstance(value, str):
+        lowered = value.lower()
+        if lowered == "true":
+            return True
+        if lowered == "false":
+            return False
+    raise ValueError(f"expected a boolean, got {value!r}")
+
+
+def enum_parser(enum_type):
+    """Accept an enum by value ("error") or by name ("ERROR")."""
+    lookup = {member.value: member for member in enum_type}
+    lookup.update({member.name: member for member in enum_type})
+    return lookup.__getitem__
+
+
+# Per row type: (field, parser, default) in column order; the parser is
+# skipped for None. trace_id comes from the event envelope.
+FIELD_SPECS = {
+    TraceRow: [
+        ("invocation_id", str, REQUIRED),
+        ("org_id", str, REQUIRED),
+        ("project_id", str, REQUIRED),
+        ("agent_id", str, REQUIRED),
+        ("version_id", str, REQUIRED),
+        ("protocol", enum_parser(Protocol), REQUIRED),
+        ("run_mode", str, "production"),
+        ("config_hash", str, None),
+        ("signature_verified", parse_bool, False),
+        ("cost_cents", int, 0),
+        ("start_timestamp", parse_timestamp, REQUIRED),
+        ("end_timestamp", parse_timestamp, None),
+    ],
+    SpanRow: [
+        ("span_id", str, REQUIRED),
+        ("parent_span_id", str, None),
+        ("kind", enum_parser(SpanKind), REQUIRED),
+        ("model_provider", str, None),
+        ("model_name", str, None),
+        ("model_params", None, None),
+        ("tokens_in", int, 0),
+        ("tokens_out", int, 0),
+        ("excerpts", str, None),
+        ("policy_enforced", None, []),
+        ("obligations", None, []),
+        ("redaction_mask_ids", None, []),
+        ("signature_verified", parse_bool, False),
+        ("status", enum_parser(SpanStatus), SpanStatus.SUCCESS),
+        ("duration_ms", int, REQUIRED),
+        ("content_hash_in", str, None),
+        ("content_hash_out", str, None),
+        ("start_timestamp", parse_timestamp, REQUIRED),
+        ("end_timestamp", parse_timestamp, REQUIRED),
+    ],
+    EdgeRow: [
+        ("edge_id", str, REQUIRED),
+        ("from_agent_id", str, REQUIRED),
+        ("from_agent_version", str, REQUIRED),
+        ("to_agent_id", str, REQUIRED),
+        ("to_agent_version", str, REQUIRED),
+        ("from_span_id", str, REQUIRED),
+        ("to_span_id", str, REQUIRED),
+        ("channel", enum_parser(Protocol), REQUIRED),
+        ("instruction_type", str, None),
+        ("signature_verified", parse_bool, False),
+        ("size_bytes", int, 0),
+        ("content_hash", str, None),
+        ("timestamp", parse_timestamp, REQUIRED),
+    ],
+    AnomalyRow: [
+        ("anomaly_id", str, REQUIRED),
+        ("span_id", str, None),
+        ("anomaly_type", enum_parser(AnomalyType), REQUIRED),
+        ("severity", str, REQUIRED),
+        ("details", None, None),
+        ("detected_at", parse_timestamp, REQUIRED),
+    ],
+}
+
+EVENT_ROW_TYPES = {"trace": TraceRow, "span": SpanRow, "edge": EdgeRow, "anomaly": AnomalyRow}
+
+# Row type -> (table, columns whose values are JSON, columns whose values are enums)
+TABLES = {
+    TraceRow: ("telemetry_traces", (), ("protocol",)),
+    SpanRow: ("telemetry_spans", ("model_params", "policy_enforced", "obligations", "redaction_mask_ids"),
+              ("kind", "status")),
+    EdgeRow: ("telemetry_edges", (), ("channel",)),
+    AnomalyRow: ("telemetry_anomalies", ("details",), ("anomaly_type",)),
+}
+
+
+# Tables of the rows attributed through their trace
+TRACE_MEMBERS = {SpanRow: TelemetrySpan, EdgeRow: TelemetryEdge, AnomalyRow: TelemetryAnomaly}
+
+# Where the envelope's trace_id goes in each row tuple
+TRACE_ID_POSITION = {row_type: row_type._fields.index("trace_id") for row_type in FIELD_SPECS}
+
+
+def decode_row(row_type, trace_id: str, data: Dict[str, Any]):
+    # Positional and without keyword arguments: this runs once per event
+    get = data.get
+    values = []
+    for name, parse, default in FIELD_SPECS[row_type]:
+        value = get(name)
+        if value is None:
+            if default is REQUIRED:
+                raise ValueError(f"missing {name}")
+            value = default
+        elif parse is not None:
+            value = parse(value)
+        values.append(value)
+    values.insert(TRACE_ID_POSITION[row_type], trace_id)
+    return row_type._make(values)
+
+
+class Batch:
+    """Decoded rows of one or more requests, grouped by table."""
+
+    def __init__(self):
+        self.rows: Dict[type, List[tuple]] = {row_type: [] for row_type in TABLES}
+        # What the anomaly detector found in these rows, kept so that
+        # retrying a failed write does not observe them twice
+        self.detected: Optional[List[AnomalyRow]] = None
+
+    @property
+    def traces(self) -> List[TraceRow]:
+        return self.rows[TraceRow]
+
+    @property
+    def spans(self) -> List[SpanRow]:
+        return self.rows[SpanRow]
+
+    @property
+    def edges(self) -> List[EdgeRow]:
+        return self.rows[EdgeRow]
+
+    @property
+    def anomalies(self) -> List[AnomalyRow]:
+        return self.rows[AnomalyRow]
+
+    def add(self, row):
+        self.rows[type(row)].append(row)
+
+    def extend(self, other: "Batch"):
+        for row_type, rows in other.rows.items():
+            self.rows[row_type].extend(rows)
+
+    def counts(self) -> Dict[str, int]:
+        return {TABLES[row_type][0]: len(rows) for row_type, rows in self.rows.items()}
+
+    def __len__(self) -> int:
+        return sum(len(rows) for rows in self.rows.values())
+
+
+def decode_events(events: Iterable[Tuple[str, str, Dict[str, Any]]]) -> Batch:
+    """Decode (event_type, trace_id, data) triples, raising InvalidEvent on the first bad one."""
+    batch = Batch()
+    for index, (event_type, trace_id, data) in enumerate(events):
+        row_type = EVENT_ROW_TYPES.get(event_type)
+        if row_type is None:
+            raise InvalidEvent(index, f"unknown event_type {event_type!r}")
+        try:
+            batch.add(decode_row(row_type, trace_id, data))
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidEvent(index, str(e) or type(e).__name__)
+    return batch
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Whether a failed write is worth retrying as is: the database was unreachable, not the data wrong."""
+    if isinstance(exc, DBAPIError):
+        if exc.connection_invalidated:
+            return True
+        exc = exc.orig.__cause__ or exc.orig
+    return isinstance(exc, (
+        OSError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError,
+        asyncpg.CannotConnectNowError, asyncpg.AdminShutdownError
+    ))
+
+
+def copy_records(row_type, rows: List[tuple]) -> List[tuple]:
+    """Row tuples as COPY records: enums by name as Postgres stores them, JSON as text."""
+    fields = row_type._fields
+    _, json_columns, enum_columns = TABLES[row_type]
+    json_positions = [fields.index(name) for name in json_columns]
+    enum_positions = [fields.index(name) for name in enum_columns]
+    records = []
+    for row in rows:
+        record = list(row)
+        for position in enum_positions:
+            record[position] = record[position].name
+        for position in json_positions:
+            if record[position] is not None:
+                record[position] = orjson.dumps(record[position], option=orjson.OPT_NON_STR_KEYS).decode()
+        records.append(record)
+    return records
+
+
+async def trace_owners(session, trace_ids: Iterable[str]) -> Dict[str, Tuple[str, str]]:
+    """(org_id, agent_id) of traces written in earlier batches."""
+    trace_ids = list(trace_ids)
+    if not trace_ids:
+        return {}
+    rows = await session.execute(
+        select(TelemetryTrace.trace_id, TelemetryTrace.org_id, TelemetryTrace.agent_id)
+        .filter(TelemetryTrace.trace_id.in_(trace_ids))
+    )
+    return {trace_id: (org_id, agent_id) for trace_id, org_id, agent_id in rows}
+
+
+async def adopt_orphans(session, traces: Iterable[TraceRow], written: Batch) -> Batch:
+    """Rows stored before their trace, for the traces just written, other than ``written`` itself."""
+    trace_ids = [trace.trace_id for trace in traces]
+    adopted = Batch()
+    if not trace_ids:
+        return adopted
+    orphaned = (await session.execute(
+        delete(IngestOrphanTrace)
+        .where(IngestOrphanTrace.trace_id.in_(trace_ids))
+        .returning(IngestOrphanTrace.trace_id)
+    )).scalars().all()
+    if not orphaned:
+        return adopted
+    for row_type, model in TRACE_MEMBERS.items():
+        written_ids = {row[0] for row in written.rows[row_type]}
+        rows = await session.execute(
+            select(*(getattr(model, name) for name in row_type._fields)).filter(model.trace_id.in_(orphaned))
+        )
+        adopted.rows[row_type].extend(row_type._make(row) for row in rows if row[0] not in written_ids)
+    return adopted
+
+
+async def record_orphans(session, trace_ids: Iterable[str]):
+    """Note traces with rows written ahead of them, for adopt_orphans."""
+    now = datetime.utcnow()
+    await session.execute(
+        insert(IngestOrphanTrace)
+        .values([{"trace_id": trace_id, "first_seen": now} for trace_id in sorted(trace_ids)])
+        .on_conflict_do_nothing()
+    )
+
+
+def detect_anomalies(detector: AnomalyDetector, counted: Batch, owners: Dict[str, Tuple[str, str]]) -> List[AnomalyRow]:
+    """Observe the traces and spans being counted, trace by trace, returning the anomalies as rows."""
+    spans_by_trace = defaultdict(list)
+    for span in counted.spans:
+        spans_by_trace[span.trace_id].append(span)
+    traces = {trace.trace_id: trace for trace in counted.traces}
+    for trace_id in spans_by_trace:
+        if trace_id not in traces and trace_id in owners:
+            traces[trace_id] = TraceRef(trace_id, owners[trace_id][1])
+
+    detected = []
+    for trace_id, trace in traces.items():
+        spans = sorted(spans_by_trace.get(trace_id, ()), key=lambda span: span.start_timestamp)
+        for anomaly in detector.observe(trace, spans):
+            detected.append(AnomalyRow(
+                anomaly.anomaly_id, anomaly.trace_id, anomaly.span_id, anomaly.anomaly_type,
+                anomaly.severity, anomaly.details, anomaly.detected_at
+            ))
+    return detected
+
+
+class WriteStats:
+    """Counters of write_batch beyond the rows written: orphans and detected anomalies."""
+
+    def __init__(self):
+        self.orphaned_rows = 0
+        self.adopted_rows = 0
+        self.detected_anomalies = 0
+
+    def stats(self) -> Dict:
+        return {
+            "orphaned_rows": self.orphaned_rows,
+            "adopted_rows": self.adopted_rows,
+            "detected_anomalies": self.detected_anomalies,
+        }
+
+
+async def insert_new_rows(connection, row_type, rows: List[tuple]) -> List[tuple]:
+    """Insert rows some of which may already exist, returning those that did not.
+
+    The rows are COPYed into a per-connection staging table and moved over
+    with ON CONFLICT DO NOTHING; repeats of an id within ``rows`` keep the
+    first occurrence.
+    """
+    table = TABLES[row_type][0]
+    stage = f"ingest_stage_{table}"
+    unique: Dict[str, tuple] = {}
+    for row in rows:
+        unique.setdefault(row[0], row)
+
+    await connection.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+    )
+    await connection.copy_records_to_table(
+        stage, records=copy_records(row_type, list(unique.values())), columns=row_type._fields
+    )
+    inserted = await connection.fetch(
+        f"INSERT INTO {table} SELECT * FROM {stage} ON CONFLICT DO NOTHING RETURNING {row_type._fields[0]}"
+    )
+    inserted_ids = {record[0] for record in inserted}
+    return [row for row in unique.values() if row[0] in inserted_ids]
+
+
+async def write_batch(
+    session,
+    batch: Batch,
+    dedup=None,
+    detector: Optional[AnomalyDetector] = None,
+    stats: Optional[WriteStats] = None
+) -> Batch:
+    """COPY a batch into the telemetry tables and fold it into the rollups in one transaction.
+
+    Rows the ``dedup`` filter (a dedup.Deduplicator) may have seen before
+    are inserted with ON CONFLICT DO NOTHING instead, and if the COPY of
+    supposedly new rows still hits an existing id the whole batch is redone
+    that way, so duplicates are dropped rather than failing the batch.
+    Rollups and live events only count the rows actually written, which
+    are returned, plus earlier orphans of the traces written now. Those
+    are also run through ``detector`` and the anomalies it reports are
+    COPYed alongside. Live events are NOTIFYed in the same transaction, so
+    subscribers only hear about rows that were committed.
+    """
+    fresh, suspect = dedup.split(batch) if dedup is not None else (batch, Batch())
+    try:
+        try:
+            written = await _write_batch(session, batch, fresh, suspect, detector, stats)
+        except asyncpg.UniqueViolationError:
+            await session.rollback()
+            if dedup is not None:
+                dedup.fallbacks += 1
+            written = await _write_batch(session, batch, Batch(), batch, detector, stats)
+    except Exception as e:
+        # COPY runs on the raw driver connection, out of sight of the pool's
+        # disconnect handling, so a dead connection has to be discarded here
+        if is_transient_error(e):
+            await session.invalidate()
+        raise
+    if dedup is not None:
+        dedup.duplicate_rows += len(batch) - len(written)
+    return written
+
+
+async def _write_batch(
+    session,
+    batch: Batch,
+    fresh: Batch,
+    suspect: Batch,
+    detector: Optional[AnomalyDetector],
+    stats: Optional[WriteStats]
+) -> Batch:
+    raw_connection = (await (await session.connection()).get_raw_connection()).driver_connection
+    written = Batch()
+    for row_type, rows in fresh.rows.items():
+        if rows:
+            await raw_connection.copy_records_to_table(
+                TABLES[row_type][0], records=copy_records(row_type, rows), columns=row_type._fields
+            )
+            written.rows[row_type].extend(rows)
+    for row_type, rows in suspect.rows.items():
+        if rows:
+            written.rows[row_type].extend(await insert_new_rows(raw_connection, row_type, rows))
+    # The trigram search index is maintained off this path (search_index.py)
+    if written.spans:
+        await raw_connection.copy_records_to_table(
+            SpanSearchQueue.__tablename__,
+            records=[(span.span_id, span.start_timestamp, span_search_document(span)) for span in written.spans],
+            columns=("span_id", "start_timestamp", "document")
+        )
+
+    # Owners come from every trace in the batch, written now or before, but
+    # only the rows written now are counted
+    batch_traces = {trace.trace_id for trace in batch.traces}
+    owners = await trace_owners(session, {
+        row.trace_id for rows in (batch.spans, batch.edges, batch.anomalies) for row in rows
+    } - batch_traces)
+    owners.update({trace.trace_id: (trace.org_id, trace.agent_id) for trace in batch.traces})
+    org_by_trace = {trace_id: org_id for trace_id, (org_id, _) in owners.items()}
+
+    orphans = [row for row_type in TRACE_MEMBERS for row in written.rows[row_type] if row.trace_id not in owners]
+    if orphans:
+        await record_orphans(session, {row.trace_id for row in orphans})
+    adopted = await adopt_orphans(session, written.traces, written)
+    counted = Batch()
+    counted.extend(written)
+    counted.extend(adopted)
+
+    detected = []
+    if detector is not None:
+        if batch.detected is None:
+            batch.detected = detect_anomalies(detector, counted, owners)
+        detected = batch.detected
+        if detected:
+            await raw_connection.copy_records_to_table(
+                TABLES[AnomalyRow][0], records=copy_records(AnomalyRow, detected), columns=AnomalyRow._fields
+            )
+            counted.anomalies.extend(detected)
+
+    # Rollups as executemany with statements compiled once per process;
+    # rows arrive sorted by key, so concurrent batches lock buckets in order
+    connection = await session.connection()
+    for statement, rows in (
+        (upsert_kpi_rollups(), kpi_rollup_rows(counted.traces, counted.spans, org_by_trace)),
+        (upsert_edge_rollups(), edge_rollup_rows(counted.edges, batch.spans + adopted.spans, org_by_trace)),
+        (upsert_latency_rollups(), latency_rollup_rows(counted.traces, counted.spans, owners)),
+    ):
+        if rows:
+            await connection.execute(statement, rows)
+
+    events = live_events(counted.traces, counted.spans, counted.anomalies, owners)
+    if events:
+        await session.execute(notify_live_events(events))
+    await session.commit()
+    if stats is not None:
+        stats.orphaned_rows += len(orphans)
+        stats.adopted_rows += len(adopted)
+        stats.detected_anomalies += len(detected)
+    return written
@@ -0,0 +1,123 @@
+"""Duplicate suppression for ingest retries.
+
+Agent SDKs retry on timeout, so the same trace, span, edge or anomaly can
+arrive more than once. Every row's id goes through a rotating Bloom filter
+of the ids this process wrote recently:
+
+* an id the filter has definitely not seen is new, and its row takes the
+  fast COPY path;
+* an id it may have seen (a retry, a repeat within the batch, or a false
+  positive) is routed to the exact path, which stages the rows and inserts
+  them with ``ON CONFLICT DO NOTHING``, so a duplicate is dropped and a
+  false positive costs a slower insert, never a lost row.
+
+Ids written before the filter's window, or by another process, look new;
+if one of those breaks the COPY the batch is redone on the exact path
+(see batch_writer.write_batch), so a retry never poisons a batch.
+
+Rows are keyed on their id (trace_id, span_id, edge_id, anomaly_id), the
+first field of every row tuple.
+"""
+import math
+from typing import Dict, Optional, Tuple
+
+from batch_writer import Batch
+
+HASH_MASK = (1 << 64) - 1
+
+
+class RotatingBloomFilter:
+    """Two Bloom filter generations covering roughly the last 1-2 x ``capacity`` keys.
+
+    Keys are added to the current generation and looked up in both; once
+    the current one holds ``capacity`` keys it becomes the previous one and
+    the oldest is discarded, which bounds memory. A new key is a false
+    positive if either generation matches it, so each is sized for
+    ``error_rate / 2`` and the two together stay within ``error_rate``.
+    Keys are hashed with the process's own ``hash()``, which is fine for a
+    filter that never leaves it.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        generation_rate = error_rate / 2
+        self.size = max(8, math.ceil(-capacity * math.log(generation_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.current = bytearray((self.size + 7) // 8)
+        self.previous: Optional[bytearray] = None
+        self.count = 0
+        self.rotations = 0
+
+    def add(self, key: str) -> bool:
+        """Add a key, returning whether it may have been added before."""
+        digest = hash(key) & HASH_MASK
+        # Double hashing: k positions from the two halves of one 64-bit hash
+        first, step = digest & 0xFFFFFFFF, (digest >> 32) | 1
+        size = self.size
+        positions = [(first + i * step) % size for i in range(self.hashes)]
+
+        # Plain loops rather than all() over generators: this runs for every row
+        current = self.current
+        for p in positions:
+            if not current[p >> 3] >> (p & 7) & 1:
+                break
+        else:
+            return True
+        previous = self.previous
+        seen = previous is not None
+        if seen:
+            for p in positions:
+                if not previous[p >> 3] >> (p & 7) & 1:
+                    seen = False
+                    break
+        for p in positions:
+            current[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+        if self.count >= self.capacity:
+            self.previous, self.current = self.current, bytearray(len(self.current))
+            self.count = 0
+            self.rotations += 1
+        return seen
+
+    def stats(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "bits": self.size,
+            "hashes": self.hashes,
+            "current_keys": self.count,
+            "rotations": self.rotations,
+        }
+
+
+class Deduplicator:
+    """Splits batches between the COPY and ON CONFLICT paths and counts what was dropped."""
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.01):
+        self.filter = RotatingBloomFilter(capacity, error_rate)
+        self.fresh_rows = 0
+        self.suspect_rows = 0
+        self.duplicate_rows = 0
+        self.fallbacks = 0
+
+    def split(self, batch: Batch) -> Tuple[Batch, Batch]:
+        """(rows whose ids are new, rows that may be duplicates), adding every id to the filter."""
+        fresh, suspect = Batch(), Batch()
+        add = self.filter.add
+        for row_type, rows in batch.rows.items():
+            fresh_rows, suspect_rows = fresh.rows[row_type], suspect.rows[row_type]
+            for row in rows:
+                (suspect_rows if add(row[0]) else fresh_rows).append(row)
+        self.fresh_rows += len(fresh)
+        self.suspect_rows += len(suspect)
+        return fresh, suspect
+
+    def stats(self) -> Dict:
+        return {
+            "fresh_rows": self.fresh_rows,
+            "suspect_rows": self.suspect_rows,
+            "duplicate_rows": self.duplicate_rows,
+            "fallbacks": self.fallbacks,
+            "filter": self.filter.stats(),
+        }
@@ -0,0 +1,246 @@
+"""Request body formats the ingest service decodes into row batches.
+
+* ``json``: the TelemetryEvent list, ``[{"event_type", "trace_id", "data"}]``.
+* ``msgpack``: the same event list msgpack-encoded. Timestamps may be
+  msgpack timestamps as well as ISO strings or epoch seconds.
+* ``otlp``: an OTLP/protobuf ExportTraceServiceRequest. Every span becomes
+  a span row and every root span also the trace row of its trace, with
+  AgentOS fields taken from ``agentos.*`` attributes (see OTLP_ATTRIBUTES)
+  on the span or its resource. OTLP has no edges or anomalies; those come
+  in through the other formats.
+
+Bodies may be gzip or zstd compressed (Content-Encoding) and are inflated
+up to a size limit. The binary formats decode straight into row tuples,
+without a Pydantic model per event.
+"""
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import msgpack
+import orjson
+import zstandard
+from google.protobuf.message import DecodeError
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.proto.trace.v1.trace_pb2 import Status
+
+from batch_writer import Batch, InvalidEvent, SpanRow, TraceRow, decode_events, enum_parser, parse_bool
+from models import Protocol, SpanKind, SpanStatus
+
+EPOCH = datetime(1970, 1, 1)
+
+ENCODINGS = ("identity", "gzip", "zstd")
+
+# Content-Encodings as decompress accepts them, after normalizing
+WAL_ENCODINGS = frozenset(ENCODINGS) | {"x-gzip"}
+
+
+class InvalidBody(ValueError):
+    """A request body that is not valid in its format at all."""
+
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+def decompress(body: bytes, encoding: Optional[str], max_bytes: int) -> bytes:
+    """Inflate a request body by its Content-Encoding, refusing to go past ``max_bytes``."""
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        data = body
+    elif encoding in ("gzip", "x-gzip"):
+        inflater = zlib.decompressobj(wbits=31)
+        try:
+            data = inflater.decompress(body, max_bytes + 1)
+        except zlib.error as e:
+            raise InvalidBody(f"bad gzip body: {e}")
+    elif encoding == "zstd":
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+                data = reader.read(max_bytes + 1)
+        except zstandard.ZstdError as e:
+            raise InvalidBody(f"bad zstd body: {e}")
+    else:
+        raise UnsupportedEncoding(f"unsupported Content-Encoding {encoding!r}, expected one of {', '.join(ENCODINGS)}")
+    if len(data) > max_bytes:
+        raise BodyTooLarge(f"request body inflates past {max_bytes} bytes")
+    return data
+
+
+def event_triples(events: Any) -> Iterable:
+    """(event_type, trace_id, data) of each event in a decoded JSON or msgpack list."""
+    if not isinstance(events, list):
+        raise InvalidBody("expected a list of events")
+    for index, event in enumerate(events):
+        try:
+            event_type, trace_id, data = event["event_type"], event["trace_id"], event["data"]
+        except (KeyError, TypeError):
+            raise InvalidEvent(index, "expected an object with event_type, trace_id and data")
+        if not (isinstance(event_type, str) and isinstance(trace_id, str) and isinstance(data, dict)):
+            raise InvalidEvent(index, "event_type and trace_id must be strings and data an object")
+        yield event_type, trace_id, data
+
+
+def decode_json(body: bytes) -> Batch:
+    try:
+        events = orjson.loads(body)
+    except ValueError as e:
+        raise InvalidBody(f"bad JSON body: {e}")
+    return decode_events(event_triples(events))
+
+
+def decode_msgpack(body: bytes) -> Batch:
+    try:
+        events = msgpack.unpackb(body, timestamp=3)
+    except (ValueError, msgpack.UnpackException) as e:
+        raise InvalidBody(f"bad msgpack body: {e}")
+    return decode_events(event_triples(events))
+
+
+# AgentOS attributes read from OTLP spans, falling back to the resource
+# for the trace-level ones; the same names the OTel export preview emits
+OTLP_ATTRIBUTES = {
+    "kind": "agentos.span.kind",
+    "model_provider": "agentos.model.provider",
+    "model_name": "agentos.model.name",
+    "tokens_in": "agentos.tokens.in",
+    "tokens_out": "agentos.tokens.out",
+    "signature_verified": "agentos.signature.verified",
+    "status": "agentos.status",
+    "content_hash_in": "agentos.content_hash.in",
+    "content_hash_out": "agentos.content_hash.out",
+    "invocation_id": "agentos.invocation_id",
+    "org_id": "agentos.org_id",
+    "project_id": "agentos.project_id",
+    "agent_id": "agentos.agent_id",
+    "version_id": "agentos.version_id",
+    "protocol": "agentos.protocol",
+    "run_mode": "agentos.run_mode",
+    "config_hash": "agentos.config_hash",
+    "cost_cents": "agentos.cost_cents",
+}
+
+parse_kind = enum_parser(SpanKind)
+parse_status = enum_parser(SpanStatus)
+parse_protocol = enum_parser(Protocol)
+
+
+def attribute_values(attributes) -> Dict[str, Any]:
+    values = {}
+    for attribute in attributes:
+        field = attribute.value.WhichOneof("value")
+        if field is not None:
+            values[attribute.key] = getattr(attribute.value, field)
+    return values
+
+
+def nanos_to_datetime(nanos: int) -> datetime:
+    return EPOCH + timedelta(microseconds=nanos // 1000)
+
+
+def otlp_trace_row(trace_id: str, span, attributes: Dict[str, Any], resource: Dict[str, Any]) -> TraceRow:
+    def value(field: str, default: Any = None):
+        name = OTLP_ATTRIBUTES[field]
+        found = attributes.get(name, resource.get(name, default))
+        if found is None:
+            raise ValueError(f"root span without {name}")
+        return found
+
+    return TraceRow(
+        trace_id=trace_id,
+        invocation_id=str(value("invocation_id", trace_id)),
+        org_id=str(value("org_id")),
+        project_id=str(value("project_id")),
+        agent_id=str(value("agent_id", resource.get("service.name"))),
+        version_id=str(value("version_id", resource.get("service.version"))),
+        protocol=parse_protocol(value("protocol", Protocol.HTTP.value)),
+        run_mode=str(value("run_mode", "production")),
+        config_hash=attributes.get(OTLP_ATTRIBUTES["config_hash"], resource.get(OTLP_ATTRIBUTES["config_hash"])),
+        signature_verified=parse_bool(attributes.get(OTLP_ATTRIBUTES["signature_verified"], False)),
+        cost_cents=int(value("cost_cents", 0)),
+        start_timestamp=nanos_to_datetime(span.start_time_unix_nano),
+        end_timestamp=nanos_to_datetime(span.end_time_unix_nano) if span.end_time_unix_nano else None,
+    )
+
+
+def otlp_span_row(trace_id: str, span, attributes: Dict[str, Any]) -> SpanRow:
+    status = attributes.get(OTLP_ATTRIBUTES["status"])
+    if status is not None:
+        status = parse_status(status)
+    elif span.status.code == Status.STATUS_CODE_ERROR:
+        status = SpanStatus.ERROR
+    else:
+        status = SpanStatus.SUCCESS
+    return SpanRow(
+        span_id=span.span_id.hex(),
+        trace_id=trace_id,
+        parent_span_id=span.parent_span_id.hex() or None,
+        kind=parse_kind(attributes.get(OTLP_ATTRIBUTES["kind"], SpanKind.SYSTEM.value)),
+        model_provider=attributes.get(OTLP_ATTRIBUTES["model_provider"]),
+        model_name=attributes.get(OTLP_ATTRIBUTES["model_name"]),
+        model_params=None,
+        tokens_in=int(attributes.get(OTLP_ATTRIBUTES["tokens_in"], 0)),
+        tokens_out=int(attributes.get(OTLP_ATTRIBUTES["tokens_out"], 0)),
+        excerpts=None,
+        policy_enforced=[],
+        obligations=[],
+        redaction_mask_ids=[],
+        signature_verified=parse_bool(attributes.get(OTLP_ATTRIBUTES["signature_verified"], False)),
+        status=status,
+        duration_ms=max(span.end_time_unix_nano - span.start_time_unix_nano, 0) // 1_000_000,
+        content_hash_in=attributes.get(OTLP_ATTRIBUTES["content_hash_in"]),
+        content_hash_out=attributes.get(OTLP_ATTRIBUTES["content_hash_out"]),
+        start_timestamp=nanos_to_datetime(span.start_time_unix_nano),
+        end_timestamp=nanos_to_datetime(span.end_time_unix_nano),
+    )
+
+
+def decode_otlp(body: bytes) -> Batch:
+    request = ExportTraceServiceRequest()
+    try:
+        request.ParseFromString(body)
+    except DecodeError as e:
+        raise InvalidBody(f"bad OTLP body: {e}")
+
+    batch = Batch()
+    index = 0
+    for resource_spans in request.resource_spans:
+        resource = attribute_values(resource_spans.resource.attributes)
+        for scope_spans in resource_spans.scope_spans:
+            for span in scope_spans.spans:
+                try:
+                    trace_id = span.trace_id.hex()
+                    attributes = attribute_values(span.attributes)
+                    if not span.parent_span_id:
+                        batch.add(otlp_trace_row(trace_id, span, attributes, resource))
+                    batch.add(otlp_span_row(trace_id, span, attributes))
+                except (KeyError, TypeError, ValueError) as e:
+                    raise InvalidEvent(index, str(e) or type(e).__name__)
+                index += 1
+    return batch
+
+
+DECODERS: Dict[str, Callable[[bytes], Batch]] = {
+    "json": decode_json,
+    "msgpack": decode_msgpack,
+    "otlp": decode_otlp,
+}
+
+
+def wal_record(fmt: str, encoding: Optional[str], body: bytes) -> bytes:
+    """A request as logged: its format and Content-Encoding, then the body as received."""
+    return f"{fmt} {(encoding or 'identity').strip().lower()}\n".encode() + body
+
+
+def decode_wal_record(payload: bytes, max_bytes: int) -> Batch:
+    """Decode a logged request. Records from before the header was added hold a bare JSON body."""
+    header, _, body = payload.partition(b"\n")
+    fmt, _, encoding = header.decode("latin-1").partition(" ")
+    if fmt not in DECODERS or encoding not in WAL_ENCODINGS:
+        fmt, encoding, body = "json", "identity", payload
+    return DECODERS[fmt](decompress(body, encoding, max_bytes))
+
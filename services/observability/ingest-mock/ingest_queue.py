@@ -0,0 +1,249 @@
+"""Bounded in-process queue between the ingest endpoint and the database.
+
+Requests hand their decoded batch to the queue and return as soon as it is
+accepted; a single background worker drains it, merging queued batches
+into one write of up to ``flush_events`` rows, or whatever has arrived
+once the oldest batch has waited ``flush_interval`` seconds. Bursts are
+absorbed by the queue and reach Postgres as a few large transactions
+instead of one per request.
+
+The queue holds at most ``max_events`` rows, counting room reserved for
+requests still being logged. A batch that does not fit is refused with
+QueueFull rather than buffered, which the endpoint turns into
+429 with a Retry-After estimated from the recent drain rate; one larger
+than ``max_events`` could never fit and is refused with BatchTooLarge
+(413) instead.
+
+A write that fails because the database is unreachable is retried with
+backoff until it goes through, holding the batches (and, once the queue
+fills up, new requests) back meanwhile. When a merged write fails on the
+data, its batches are retried one by one so a single bad request (a
+token count too large for its column, say) only loses its own rows.
+Either way ``on_done`` then receives the sequence numbers the batches
+were queued with, which is how the write-ahead log learns what it no
+longer has to keep.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from batch_writer import Batch, is_transient_error
+
+logger = logging.getLogger(__name__)
+
+# Flush latencies kept for the reported percentiles
+LATENCY_WINDOW = 1024
+
+# Backoff between attempts while the database is unreachable, in seconds
+RETRY_DELAY = 0.1
+MAX_RETRY_DELAY = 5.0
+
+
+class QueueFull(Exception):
+    """The queue cannot take the batch; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"ingest queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class BatchTooLarge(Exception):
+    """The batch is bigger than the whole queue, so retrying it cannot help."""
+
+    def __init__(self, size: int, max_events: int):
+        super().__init__(f"request of {size} rows exceeds the ingest queue's {max_events}, split it up")
+        self.size = size
+        self.max_events = max_events
+
+
+class IngestQueue:
+    def __init__(
+        self,
+        write: Callable[[Batch], Awaitable[None]],
+        max_events: int = 100000,
+        flush_events: int = 5000,
+        flush_interval: float = 0.05,
+        on_done: Optional[Callable[[List[int]], None]] = None
+    ):
+        self.write = write
+        self.on_done = on_done
+        self.max_events = max_events
+        self.flush_events = flush_events
+        self.flush_interval = flush_interval
+        self.depth = 0
+        self.reserved = 0
+        self.accepted_events = 0
+        self.rejected_requests = 0
+        self.flushed_events = 0
+        self.failed_events = 0
+        self.flushes = 0
+        self.retries = 0
+        self.database_available = True
+        # (batch, seq, time it was queued)
+        self._batches: Deque[Tuple[Batch, Optional[int], float]] = deque()
+        self._pending = asyncio.Event()
+        self._filled = asyncio.Event()
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._flush_sizes: Deque[int] = deque(maxlen=LATENCY_WINDOW)
+        self._worker: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._closing = False
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self, timeout: float = 10):
+        """Stop accepting batches and flush whatever is queued, giving up after ``timeout`` seconds."""
+        self._closing = True
+        self._pending.set()
+        self._filled.set()
+        if self._worker is not None:
+            try:
+                await asyncio.wait_for(self._worker, timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Ingest queue closed with %d rows unwritten", self.depth)
+            self._worker = None
+
+    def reserve(self, size: int):
+        """Hold room for a batch of ``size`` rows until ``release``, or raise QueueFull (BatchTooLarge if never).
+
+        Requests reserve before they await the write-ahead log, so
+        concurrent ones cannot all pass the limit and overfill the queue.
+        """
+        self._check(size)
+        self.reserved += size
+
+    def release(self, size: int):
+        self.reserved -= size
+
+    def _check(self, size: int):
+        if size > self.max_events:
+            self.rejected_requests += 1
+            raise BatchTooLarge(size, self.max_events)
+        if self._closing or self.depth + self.reserved + size > self.max_events:
+            self.rejected_requests += 1
+            raise QueueFull(self.retry_after())
+
+    def put(self, batch: Batch, seq: Optional[int] = None, force: bool = False):
+        """Queue a batch for writing, or raise QueueFull or BatchTooLarge without queueing any of it.
+
+        ``seq`` is handed to ``on_done`` once the batch is written or
+        rejected; ``force`` skips the size limit, for batches already
+        accepted elsewhere such as those replayed from the write-ahead log
+        or with room reserved.
+        """
+        size = len(batch)
+        if not force:
+            self._check(size)
+        self._batches.append((batch, seq, time.monotonic()))
+        self.depth += size
+        self.accepted_events += size
+        self._pending.set()
+        if self.depth >= self.flush_events:
+            self._filled.set()
+
+    def retry_after(self) -> int:
+        """Seconds until the queue has drained, at the recent rows per second of flushing."""
+        busy = sum(self._latencies)
+        if not busy:
+            return 1
+        rate = sum(self._flush_sizes) / busy
+        return max(1, math.ceil(self.depth / rate))
+
+    async def _run(self):
+        while True:
+            await self._pending.wait()
+            if not self._batches:
+                if self._closing:
+                    return
+                self._pending.clear()
+                continue
+            # Wait for a full flush or for the oldest batch's deadline, whichever comes first
+            remaining = self._batches[0][2] + self.flush_interval - time.monotonic()
+            if self.depth < self.flush_events and remaining > 0 and not self._closing:
+                self._filled.clear()
+                try:
+                    await asyncio.wait_for(self._filled.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            await self._flush()
+
+    def _take(self) -> List[Tuple[Batch, Optional[int], float]]:
+        taken = [self._batches.popleft()]
+        size = len(taken[0][0])
+        while self._batches and size + len(self._batches[0][0]) <= self.flush_events:
+            size += len(self._batches[0][0])
+            taken.append(self._batches.popleft())
+        return taken
+
+    async def _flush(self):
+        taken = self._take()
+        merged = Batch()
+        for batch, _, _ in taken:
+            merged.extend(batch)
+
+        started = time.perf_counter()
+        failed = 0
+        if not await self._write(merged):
+            if len(taken) == 1:
+                failed = len(merged)
+            else:
+                logger.warning("Merged ingest write of %d batches failed, retrying one by one", len(taken))
+                for batch, _, _ in taken:
+                    if not await self._write(batch):
+                        failed += len(batch)
+        self.flushed_events += len(merged) - failed
+        self.failed_events += failed
+        self.depth -= len(merged)
+        self.flushes += 1
+        self._latencies.append(time.perf_counter() - started)
+        self._flush_sizes.append(len(merged))
+        if self.on_done is not None:
+            self.on_done([seq for _, seq, _ in taken if seq is not None])
+
+    async def _write(self, batch: Batch) -> bool:
+        """Write a batch, waiting out database outages; False if the rows themselves were refused."""
+        delay = RETRY_DELAY
+        while True:
+            try:
+                await self.write(batch)
+                self.database_available = True
+                return True
+            except Exception as e:
+                if not is_transient_error(e):
+                    logger.exception("Dropping ingest batch of %d rows", len(batch))
+                    return False
+                self.database_available = False
+                self.retries += 1
+                logger.warning("Database unavailable (%s), retrying ingest write in %.1fs", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def stats(self) -> Dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2)
+
+        return {
+            "depth": self.depth,
+            "max_events": self.max_events,
+            "reserved": self.reserved,
+            "queued_batches": len(self._batches),
+            "accepted_events": self.accepted_events,
+            "rejected_requests": self.rejected_requests,
+            "flushed_events": self.flushed_events,
+            "failed_events": self.failed_events,
+            "flushes": self.flushes,
+            "retries": self.retries,
+            "database_available": self.database_available,
+            "mean_flush_events": round(sum(self._flush_sizes) / len(self._flush_sizes)) if self._flush_sizes else None,
+            "flush_p50_ms": percentile(0.50),
+            "flush_p99_ms": percentile(0.99),
+        }
@@ -0,0 +1,297 @@
+"""Segmented, checksummed write-ahead log for accepted ingest requests.
+
+Each accepted request is appended as one record before it is acknowledged,
+so a batch still waiting in the ingest queue survives a crash or a
+database outage. Records are framed as
+
+    <payload length: u32> <crc32 of payload: u32> <sequence number: u64> <payload>
+
+in append-only segment files named after the first sequence number they
+may hold, and a new segment is started once the current one reaches
+``segment_bytes``.
+
+Appends and fsyncs run in order on one dedicated thread. Concurrent
+requests share fsyncs (group commit): ``sync`` waits for one fsync that
+covers everything appended before it started, so acknowledgements keep up
+with the disk rather than with one fsync per request.
+
+A failed append or fsync fails the records it may have lost, and the
+next append starts a new segment, so the log recovers once the disk does
+(space is freed, say) instead of refusing every request until restart.
+Anything torn in the old segment stays behind the segment boundary.
+
+Once a record's batch is committed to Postgres (or rejected for good) it is
+marked done. Segments holding only done records are deleted, the active
+segment is truncated whenever everything in it is done, and the highest
+sequence number below which everything is done is checkpointed, so a
+restart replays only what was not yet written. Replay is at least once: a
+crash between the database commit and the checkpoint replays that batch
+again. A record that cannot be replayed at all is moved to the dead-letter
+file, framed the same way, rather than dropped.
+"""
+import asyncio
+import logging
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct("<IIQ")
+SEGMENT_SUFFIX = ".wal"
+CHECKPOINT_FILE = "checkpoint"
+DEAD_LETTER_FILE = "dead_letter"
+
+
+class WalError(Exception):
+    """The log could not be written; the record must not be acknowledged."""
+
+
+def segment_path(directory: str, first_seq: int) -> str:
+    return os.path.join(directory, f"{first_seq:020d}{SEGMENT_SUFFIX}")
+
+
+def read_segment(path: str) -> Iterator[Tuple[int, bytes]]:
+    """Yield (sequence number, payload) records up to the first torn or corrupt one."""
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset < len(data):
+        if offset + HEADER.size > len(data):
+            logger.warning("Torn record header at %s:%d, ignoring the rest of the segment", path, offset)
+            return
+        length, checksum, seq = HEADER.unpack_from(data, offset)
+        start = offset + HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            logger.warning("Torn or corrupt record %d at %s:%d, ignoring the rest of the segment", seq, path, offset)
+            return
+        yield seq, payload
+        offset = start + length
+
+
+class WriteAheadLog:
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, fsync: bool = True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.last_seq = 0
+        self.synced_seq = 0
+        self.checkpoint = 0
+        self.appended = 0
+        self.replayed = 0
+        self.dead_letters = 0
+        # First sequence number of each segment file, oldest first
+        self.segments: List[int] = []
+        self._outstanding: Dict[int, None] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wal")
+        self._fd: Optional[int] = None
+        self._size = 0
+        self._written_seq = 0
+        # Highest sequence number written and fsynced (or written, without fsync)
+        self._durable_seq = 0
+        # Records that were never made durable, reported by ``sync``
+        self._lost: Set[int] = set()
+        self._error: Optional[BaseException] = None
+        self.recoveries = 0
+        self._syncing: Optional[asyncio.Future] = None
+
+    def open(self) -> List[Tuple[int, bytes]]:
+        """Scan the log, returning the records not yet done, and start a new segment for appends.
+
+        The returned records are outstanding until marked done, like
+        freshly appended ones.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.checkpoint = self._read_checkpoint()
+        pending = []
+        self.segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX)
+        )
+        last_seq = self.checkpoint
+        for first_seq in self.segments:
+            for seq, payload in read_segment(segment_path(self.directory, first_seq)):
+                last_seq = max(last_seq, seq)
+                if seq > self.checkpoint:
+                    pending.append((seq, payload))
+        pending.sort()
+        # Appends go to a new segment past every existing one, never after a torn record
+        self.last_seq = self.synced_seq = max([last_seq] + self.segments[-1:])
+        self._written_seq = self._durable_seq = self.last_seq
+        for seq, _ in pending:
+            self._outstanding[seq] = None
+        self.replayed = len(pending)
+        self._start_segment(self.last_seq + 1)
+        self._truncate(self._done_through())
+        return pending
+
+    def append(self, payload: bytes) -> int:
+        """Queue a record for writing and return its sequence number; ``sync`` makes it durable."""
+        self.last_seq += 1
+        self.appended += 1
+        self._outstanding[self.last_seq] = None
+        self._executor.submit(self._write, self.last_seq, payload)
+        return self.last_seq
+
+    async def sync(self, seq: int):
+        """Wait until record ``seq`` is on disk, raising WalError if it could not be written."""
+        while self.synced_seq < seq:
+            if self._syncing is None:
+                self._syncing = asyncio.ensure_future(self._sync())
+            await asyncio.shield(self._syncing)
+        if seq in self._lost:
+            self._lost.discard(seq)
+            raise WalError(f"write-ahead log record {seq} could not be written")
+
+    def done(self, seqs):
+        """Mark records as written to the database (or dropped), truncating what is no longer needed."""
+        for seq in seqs:
+            self._outstanding.pop(seq, None)
+            self._lost.discard(seq)
+        self._executor.submit(self._truncate, self._done_through())
+
+    def dead_letter(self, seq: int, payload: bytes):
+        """Move a record that cannot be replayed to the dead-letter file and mark it done.
+
+        Raises OSError, leaving the record outstanding, if it could not be
+        saved there.
+        """
+        with open(os.path.join(self.directory, DEAD_LETTER_FILE), "ab") as f:
+            f.write(HEADER.pack(len(payload), zlib.crc32(payload), seq) + payload)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self.dead_letters += 1
+        self.done([seq])
+
+    def close(self):
+        self._executor.submit(self._close, self._done_through())
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        return {
+            "last_seq": self.last_seq,
+            "synced_seq": self.synced_seq,
+            "checkpoint": self.checkpoint,
+            "outstanding_records": len(self._outstanding),
+            "appended_records": self.appended,
+            "replayed_records": self.replayed,
+            "dead_letter_records": self.dead_letters,
+            "segments": len(self.segments),
+            "active_segment_bytes": self._size,
+            "recoveries": self.recoveries,
+            "error": str(self._error) if self._error is not None else None,
+        }
+
+    def _done_through(self) -> int:
+        """Highest sequence number at or below which every record is done."""
+        return next(iter(self._outstanding)) - 1 if self._outstanding else self.last_seq
+
+    async def _sync(self):
+        target = self.last_seq
+        try:
+            await asyncio.wrap_future(self._executor.submit(self._flush))
+            self.synced_seq = max(self.synced_seq, target)
+        finally:
+            self._syncing = None
+
+    # Everything below runs on the log's thread, in submission order
+
+    def _write(self, seq: int, payload: bytes):
+        try:
+            if self._error is not None:
+                self._recover(seq)
+            elif self._size >= self.segment_bytes:
+                self._rotate(seq)
+            record = HEADER.pack(len(payload), zlib.crc32(payload), seq) + payload
+            os.write(self._fd, record)
+            self._size += len(record)
+            self._written_seq = seq
+        except OSError as e:
+            logger.exception("Write-ahead log append failed")
+            self._error = e
+            self._lost.add(seq)
+
+    def _flush(self):
+        if self._error is not None:
+            raise WalError(f"write-ahead log unavailable: {self._error}")
+        try:
+            self._fsync()
+        except OSError as e:
+            self._error = e
+            raise WalError(f"write-ahead log unavailable: {e}")
+
+    def _fsync(self):
+        """Make the active segment durable; if that fails, what was written to it since is lost."""
+        if self.fsync and self._durable_seq < self._written_seq:
+            try:
+                os.fsync(self._fd)
+            except OSError:
+                # Retrying the fsync could succeed without the pages having been written
+                self._lost.update(range(self._durable_seq + 1, self._written_seq + 1))
+                self._durable_seq = self._written_seq
+                raise
+        self._durable_seq = self._written_seq
+
+    def _recover(self, first_seq: int):
+        """Continue in a new segment after a failure, leaving any torn record behind."""
+        if self._fd is not None:
+            try:
+                self._fsync()
+            except OSError:
+                pass
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+        self._start_segment(first_seq)
+        self._error = None
+        self.recoveries += 1
+        logger.warning("Write-ahead log recovered, continuing in a new segment at %d", first_seq)
+
+    def _start_segment(self, first_seq: int):
+        self._fd = os.open(segment_path(self.directory, first_seq), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._size = 0
+        self.segments.append(first_seq)
+
+    def _rotate(self, first_seq: int):
+        self._fsync()
+        os.close(self._fd)
+        self._fd = None
+        self._start_segment(first_seq)
+
+    def _truncate(self, done_through: int):
+        if done_through > self.checkpoint:
+            self._write_checkpoint(done_through)
+            self.checkpoint = done_through
+        # A segment holds sequence numbers below the next segment's first
+        while len(self.segments) > 1 and self.segments[1] - 1 <= done_through:
+            os.remove(segment_path(self.directory, self.segments.pop(0)))
+        # Records appended after done_through was taken are only written after
+        # this runs, so once everything written is done the segment can be emptied
+        if self._size and self._written_seq <= done_through and self._error is None:
+            os.ftruncate(self._fd, 0)
+            self._size = 0
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE)) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_checkpoint(self, seq: int):
+        # Not fsynced: a stale checkpoint only means replaying more on restart
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(str(seq))
+        os.replace(path + ".tmp", path)
+
+    def _close(self, done_through: int):
+        self._truncate(done_through)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
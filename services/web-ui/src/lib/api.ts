@@ -64,6 +64,28 @@ export interface Edge {
   timestamp: string;
 }
 
+export interface SpanNode extends Span {
+  children: string[];
+}
+
+export interface Anomaly {
+  anomaly_id: string;
+  trace_id: string;
+  span_id?: string;
+  anomaly_type: string;
+  severity: string;
+  details?: Record<string, any>;
+  detected_at: string;
+}
+
+export interface TraceBundle {
+  trace: Trace;
+  root_span_ids: string[];
+  spans: SpanNode[];
+  edges: Edge[];
+  anomalies: Anomaly[];
+}
+
 export interface CostSummary {
   total_cost_cents: number;
   total_tokens_in: number;
@@ -71,6 +93,70 @@ export interface CostSummary {
   invocation_count: number;
   by_provider: Record<string, any>;
   by_agent: Record<string, any>;
+  start: string;
+  end: string;
+  granularity?: 'hour' | 'day' | 'week';
+  series?: {
+    bucket: string;
+    cost_cents: number;
+    tokens_in: number;
+    tokens_out: number;
+    invocations: number;
+  }[];
+}
+
+export interface ServiceMapEdge {
+  from_agent_id: string;
+  to_agent_id: string;
+  channel: string;
+  call_count: number;
+  error_count: number;
+  error_rate: number;
+  size_bytes: number;
+  signature_failure_rate: number;
+  latency_avg_ms: number | null;
+  latency_ms: Record<string, number | null>;
+}
+
+export interface ServiceMap {
+  org_id: string;
+  start: string;
+  end: string;
+  agents: string[];
+  edges: ServiceMapEdge[];
+}
+
+export interface LatencyDistribution {
+  agent_id?: string | null;
+  kind?: string | null;
+  model_name?: string | null;
+  span_count: number;
+  avg_ms: number | null;
+  percentiles_ms: Record<string, number | null>;
+  counts: number[];
+  heatmap?: { bucket: string; counts: number[] }[] | null;
+}
+
+export interface LatencyHistogram {
+  org_id: string;
+  start: string;
+  end: string;
+  group_by: string[];
+  interval: 'minute' | 'hour' | 'day' | null;
+  // counts[i] covers [bounds_ms[i], bounds_ms[i + 1]) milliseconds
+  bounds_ms: (number | null)[];
+  distributions: LatencyDistribution[];
+}
+
+export interface LiveEvent {
+  type: 'trace' | 'error_span' | 'anomaly';
+  org_id: string;
+  agent_id: string;
+  trace_id: string;
+  span_id?: string | null;
+  anomaly_id?: string;
+  at: string;
+  [key: string]: any;
 }
 
 export interface Agent {
@@ -154,6 +240,10 @@ class ApiClient {
     return this.fetch<Trace>(`/api/traces/${traceId}`);
   }
 
+  async getTraceBundle(traceId: string): Promise<TraceBundle> {
+    return this.fetch<TraceBundle>(`/api/traces/${traceId}/bundle`);
+  }
+
   // Spans
   async listSpans(params?: {
     trace_id?: string;
@@ -181,11 +271,70 @@ class ApiClient {
     org_id: string;
     range?: string;
     project_id?: string;
+    start?: string;
+    end?: string;
+    granularity?: 'hour' | 'day' | 'week';
   }): Promise<CostSummary> {
     const query = new URLSearchParams(params as any).toString();
     return this.fetch<CostSummary>(`/api/cost/summary?${query}`);
   }
 
+  // Live tail (Server-Sent Events); close the returned EventSource to unsubscribe
+  subscribeLive(
+    params: { org_id?: string; agent_id?: string; types?: string },
+    onEvent: (event: LiveEvent) => void
+  ): EventSource {
+    const query = new URLSearchParams(params as any).toString();
+    const source = new EventSource(`${this.baseUrl}/api/live?${query}`);
+    for (const type of ['trace', 'error_span', 'anomaly']) {
+      source.addEventListener(type, (message) => onEvent(JSON.parse((message as MessageEvent).data)));
+    }
+    return source;
+  }
+
+  // Anomalies, newest first
+  async getAnomalies(params?: {
+    type?: string;
+    severity?: string;
+    org_id?: string;
+    agent_id?: string;
+    trace_id?: string;
+    start?: string;
+    end?: string;
+    limit?: number;
+    cursor?: string;
+  }): Promise<Anomaly[]> {
+    const query = new URLSearchParams(params as any).toString();
+    return this.fetch<Anomaly[]>(`/api/anomalies?${query}`);
+  }
+
+  // Service map
+  async getServiceMap(params: {
+    org_id: string;
+    range?: string;
+    start?: string;
+    end?: string;
+  }): Promise<ServiceMap> {
+    const query = new URLSearchParams(params as any).toString();
+    return this.fetch<ServiceMap>(`/api/service-map?${query}`);
+  }
+
+  // Latency distributions and heatmaps
+  async getLatencyHistogram(params: {
+    org_id: string;
+    range?: string;
+    start?: string;
+    end?: string;
+    agent_id?: string;
+    kind?: string;
+    model_name?: string;
+    group_by?: string;
+    interval?: 'minute' | 'hour' | 'day';
+  }): Promise<LatencyHistogram> {
+    const query = new URLSearchParams(params as any).toString();
+    return this.fetch<LatencyHistogram>(`/api/latency/histogram?${query}`);
+  }
+
   // Catalog
   async searchCatalog(params?: {
     protocol?: string;
@@ -239,7 +388,15 @@ class ApiClient {
     return this.fetch('/api/demo/seed', { method: 'POST' });
   }
 
-  async simulateIncident(): Promise<{ status: string; message: string; anomalies: number }> {
+  async simulateIncident(): Promise<{
+    status: string;
+    message: string;
+    trace_id: string;
+    agent_id: string;
+    spans: number;
+    anomalies: number;
+    anomaly_types: string[];
+  }> {
     return this.fetch('/api/demo/simulate_incident', { method: 'POST' });
   }
 }
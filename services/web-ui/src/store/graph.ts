@@ -20,6 +20,9 @@ export interface GraphNode {
   risk_flags: string[];
   policy_ids: string[];
   config_hash?: string;
+  self_time_ms?: number;
+  fan_in?: number;
+  fan_out?: number;
 }
 
 export interface GraphEdge {
@@ -33,6 +36,8 @@ export interface GraphEdge {
   status: string;
   risk_flags: string[];
   edge_confidence: number;
+  from_agent_id?: string;
+  to_agent_id?: string;
 }
 
 export interface GraphPath {
@@ -40,6 +45,9 @@ export interface GraphPath {
   nodes: string[];
   edges: string[];
   total_latency_ms: number;
+  cost_cents?: number;
+  tokens_in?: number;
+  tokens_out?: number;
   cumulative_hallucination: number;
   min_confidence: number;
   policy_outcomes: string[];
@@ -61,6 +69,9 @@ export interface GraphData {
     error_nodes: number;
     avg_confidence: number;
     avg_hallucination: number;
+    max_fan_in?: number;
+    max_fan_out?: number;
+    longest_path_latency_ms?: number;
   };
   paths: GraphPath[];
 }
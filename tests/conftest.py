@@ -0,0 +1,17 @@
+"""Put the shared db modules and the service directories on sys.path.
+
+Services import their siblings and the db modules as top-level modules, the
+way their Docker images lay them out, so the tests do the same.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in (
+    os.path.join(ROOT, "db"),
+    os.path.join(ROOT, "services", "observability", "api-mock"),
+    os.path.join(ROOT, "services", "observability", "ingest-mock"),
+):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,28 @@
+import pytest
+
+from batch_writer import InvalidEvent, decode_events
+
+TRACE = {
+    "invocation_id": "inv1",
+    "org_id": "org1",
+    "project_id": "proj1",
+    "agent_id": "agent-a",
+    "version_id": "v1",
+    "protocol": "http",
+    "start_timestamp": "2024-01-01T00:00:00Z",
+}
+
+
+@pytest.mark.parametrize("value, verified", [
+    (True, True), (False, False), ("true", True), ("False", False), (None, False),
+])
+def test_signature_verified_accepts_booleans(value, verified):
+    batch = decode_events([("trace", "t1", {**TRACE, "signature_verified": value})])
+    assert batch.traces[0].signature_verified is verified
+
+
+@pytest.mark.parametrize("value", ["0", "1", "no", "", 0, 1, []])
+def test_signature_verified_rejects_anything_else(value):
+    with pytest.raises(InvalidEvent) as raised:
+        decode_events([("trace", "t0", TRACE), ("trace", "t1", {**TRACE, "signature_verified": value})])
+    assert raised.value.index == 1
@@ -0,0 +1,25 @@
+from dedup import RotatingBloomFilter
+
+
+def test_keys_from_both_generations_are_reported_as_seen():
+    bloom = RotatingBloomFilter(capacity=100, error_rate=0.01)
+    keys = [f"span_{i}" for i in range(150)]
+    for key in keys:
+        bloom.add(key)
+    assert bloom.rotations == 1
+    # Seen keys from the previous generation are re-added to the current
+    # one, so only as many as it has room for before rotating again
+    assert all(bloom.add(key) for key in keys[100:] + keys[:50])
+
+
+def test_false_positive_rate_across_both_generations_stays_within_error_rate():
+    capacity, error_rate = 50_000, 0.01
+    bloom = RotatingBloomFilter(capacity, error_rate)
+    # A full previous generation and a half full current one
+    for i in range(capacity + capacity // 2):
+        bloom.add(f"old_{i}")
+    probes = 20_000
+    false_positives = sum(bloom.add(f"new_{i}") for i in range(probes))
+    # About 0.5% with each generation sized for error_rate / 2; sized for
+    # error_rate each, the two together gave over 1%
+    assert false_positives / probes < 0.75 * error_rate
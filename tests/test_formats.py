@@ -0,0 +1,43 @@
+import gzip
+import json
+
+import pytest
+
+from batch_writer import InvalidEvent
+from formats import DECODERS, decode_wal_record, wal_record
+
+EVENTS = [{"event_type": "span", "trace_id": "t1", "data": {
+    "span_id": "s1", "kind": "tool", "duration_ms": 5,
+    "start_timestamp": "2024-01-01T00:00:00", "end_timestamp": "2024-01-01T00:00:00.005000",
+}}]
+BODY = json.dumps(EVENTS, indent=2).encode()
+
+
+@pytest.mark.parametrize("record", [
+    wal_record("json", None, BODY),
+    wal_record("json", "gzip", gzip.compress(BODY)),
+    # Logged before records had a format header
+    BODY,
+    json.dumps(EVENTS).encode(),
+], ids=["json", "gzip", "legacy-multiline", "legacy-one-line"])
+def test_wal_records_decode_with_or_without_a_header(record):
+    batch = decode_wal_record(record, 1 << 20)
+    assert [span.span_id for span in batch.spans] == ["s1"]
+
+
+def test_undecodable_wal_record_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_wal_record(wal_record("msgpack", None, b"\xc1"), 1 << 20)
+
+
+@pytest.mark.parametrize("event", [
+    {"event_type": "span", "trace_id": 1, "data": {}},
+    {"event_type": "span", "trace_id": "t1", "data": []},
+    {"event_type": ["span"], "trace_id": "t1", "data": {}},
+    {"event_type": "span", "trace_id": "t1"},
+    "span",
+], ids=["trace-id-number", "data-list", "event-type-list", "missing-data", "not-an-object"])
+def test_malformed_events_are_rejected_with_their_index(event):
+    with pytest.raises(InvalidEvent) as raised:
+        DECODERS["json"](json.dumps(EVENTS + [event]).encode())
+    assert raised.value.index == 1
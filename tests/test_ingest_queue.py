@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import pytest
+
+from batch_writer import Batch, TraceRow
+from ingest_queue import BatchTooLarge, IngestQueue, QueueFull
+
+
+def batch(rows: int) -> Batch:
+    batch = Batch()
+    batch.rows[TraceRow].extend([None] * rows)
+    return batch
+
+
+def test_batch_larger_than_the_queue_is_too_large_not_full():
+    queue = IngestQueue(None, max_events=10)
+    with pytest.raises(BatchTooLarge):
+        queue.reserve(11)
+    queue.put(batch(8), force=True)
+    with pytest.raises(QueueFull):
+        queue.reserve(3)
+    queue.reserve(2)
+
+
+def test_reserved_room_counts_against_the_limit_until_released():
+    queue = IngestQueue(None, max_events=10)
+    queue.reserve(6)
+    with pytest.raises(QueueFull):
+        queue.reserve(6)
+    queue.put(batch(6), force=True)
+    queue.release(6)
+    queue.reserve(4)
+    with pytest.raises(QueueFull):
+        queue.put(batch(1))
+
+
+def test_batch_left_behind_keeps_its_own_deadline():
+    written = []
+
+    async def write(merged: Batch):
+        written.append((len(merged), time.monotonic()))
+        if len(written) == 1:
+            await asyncio.sleep(0.4)
+
+    async def run():
+        queue = IngestQueue(write, flush_events=10, flush_interval=0.5)
+        queue.start()
+        queue.put(batch(10))
+        await asyncio.sleep(0.01)
+        # Queued while the first write is in progress; only the first fits the next flush
+        queued = time.monotonic()
+        queue.put(batch(6))
+        queue.put(batch(6))
+        while len(written) < 3:
+            await asyncio.sleep(0.01)
+        await queue.close()
+        return queued
+
+    queued = asyncio.run(run())
+    assert [size for size, _ in written] == [10, 6, 6]
+    assert written[2][1] - queued < 0.6
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import SpanKind, TelemetrySpan
+from trace_analysis import analyze_paths, analyze_trace, build_span_tree
+
+START = datetime(2024, 1, 1)
+
+
+def span(span_id, parent_span_id=None, start_ms=0, duration_ms=100):
+    return TelemetrySpan(
+        span_id=span_id,
+        trace_id="t1",
+        parent_span_id=parent_span_id,
+        kind=SpanKind.PROMPT,
+        duration_ms=duration_ms,
+        start_timestamp=START + timedelta(milliseconds=start_ms),
+        end_timestamp=START + timedelta(milliseconds=start_ms + duration_ms),
+    )
+
+
+def test_tree_links_children_in_start_order():
+    spans = [span("root", duration_ms=300), span("b", "root", 150), span("a", "root", 10)]
+    ordered, roots, children = build_span_tree(spans)
+    assert [s.span_id for s in ordered] == ["root", "a", "b"]
+    assert roots == ["root"]
+    assert children["root"] == ["a", "b"]
+
+
+def test_span_with_missing_parent_is_a_root():
+    _, roots, _ = build_span_tree([span("root"), span("orphan", "gone", 50)])
+    assert roots == ["root", "orphan"]
+
+
+@pytest.mark.parametrize("spans, cut", [
+    ([span("root"), span("x", "x", 10)], "x"),
+    ([span("root"), span("x", "y", 10), span("y", "x", 20)], "x"),
+    ([span("root"), span("y", "x", 20), span("x", "y", 10), span("z", "y", 30, 10)], "x"),
+], ids=["self-parent", "two-cycle", "cycle-with-descendant"])
+def test_parent_cycles_are_cut_at_their_earliest_span(spans, cut):
+    ordered, roots, children = build_span_tree(spans)
+    assert roots == ["root", cut]
+    assert cut not in [c for child_ids in children.values() for c in child_ids]
+    # Every span hangs off exactly one root
+    seen = []
+    stack = list(roots)
+    while stack:
+        seen.append(stack.pop())
+        stack.extend(children[seen[-1]])
+    assert sorted(seen) == sorted(s.span_id for s in ordered)
+
+
+@pytest.mark.parametrize("spans", [
+    [span("root", duration_ms=300), span("x", "x", 10)],
+    [span("root", duration_ms=300), span("x", "y", 10, 200), span("y", "x", 20, 50)],
+], ids=["self-parent", "two-cycle"])
+def test_analysis_covers_spans_on_parent_cycles(spans):
+    analysis = analyze_trace("agent-a", spans, [])
+    assert {t["span_id"] for t in analysis["spans"]} == {s.span_id for s in spans}
+    assert analysis["root_span_ids"] == ["root", "x"]
+    assert analysis["critical_path"]["span_ids"][0] == "root"
+
+    paths = analyze_paths(spans, [], k=3)
+    assert set(paths["self_time_ms"]) == {s.span_id for s in spans}
+
+
+def test_analysis_self_time_excludes_overlapping_children():
+    spans = [
+        span("root", duration_ms=300),
+        span("a", "root", 0, 100),
+        span("b", "root", 50, 100),
+    ]
+    analysis = analyze_trace("agent-a", spans, [])
+    root = next(t for t in analysis["spans"] if t["span_id"] == "root")
+    assert root["child_time_ms"] == 150
+    assert root["self_time_ms"] == 150
+    assert analysis["critical_path"]["span_ids"] == ["root", "b"]
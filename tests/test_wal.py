@@ -0,0 +1,155 @@
+import asyncio
+import errno
+import os
+
+import pytest
+
+import wal as wal_module
+from wal import CHECKPOINT_FILE, DEAD_LETTER_FILE, HEADER, SEGMENT_SUFFIX, WalError, WriteAheadLog, read_segment, segment_path
+
+
+def segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+def append_all(wal, payloads):
+    async def run():
+        seqs = [wal.append(payload) for payload in payloads]
+        await asyncio.gather(*(wal.sync(seq) for seq in seqs))
+        return seqs
+    return asyncio.run(run())
+
+
+def crash(wal):
+    """Stop the log's thread without closing it, as if the process died."""
+    wal._executor.shutdown(wait=True)
+
+
+def test_records_are_framed_with_length_checksum_and_sequence(tmp_path):
+    wal = WriteAheadLog(str(tmp_path))
+    assert wal.open() == []
+    assert append_all(wal, [b"first", b"second record"]) == [1, 2]
+    crash(wal)
+
+    (name,) = segment_files(tmp_path)
+    with open(tmp_path / name, "rb") as f:
+        data = f.read()
+    assert HEADER.unpack_from(data, 0)[::2] == (5, 1)
+    assert data[HEADER.size:HEADER.size + 5] == b"first"
+    assert list(read_segment(str(tmp_path / name))) == [(1, b"first"), (2, b"second record")]
+
+
+def test_replay_after_crash_returns_records_not_done(tmp_path):
+    wal = WriteAheadLog(str(tmp_path))
+    wal.open()
+    append_all(wal, [b"a", b"b", b"c"])
+    wal.done([1, 3])
+    crash(wal)
+
+    reopened = WriteAheadLog(str(tmp_path))
+    assert reopened.open() == [(2, b"b"), (3, b"c")]
+    assert reopened.replayed == 2
+    # New appends continue after the replayed records
+    assert append_all(reopened, [b"d"]) == [4]
+    reopened.done([2, 3, 4])
+    reopened.close()
+    assert WriteAheadLog(str(tmp_path)).open() == []
+
+
+def test_torn_tail_is_ignored_and_appends_go_to_a_new_segment(tmp_path):
+    wal = WriteAheadLog(str(tmp_path))
+    wal.open()
+    append_all(wal, [b"whole", b"torn"])
+    crash(wal)
+    (name,) = segment_files(tmp_path)
+    with open(tmp_path / name, "r+b") as f:
+        f.truncate(os.path.getsize(tmp_path / name) - 2)
+
+    reopened = WriteAheadLog(str(tmp_path))
+    assert reopened.open() == [(1, b"whole")]
+    append_all(reopened, [b"after"])
+    crash(reopened)
+    assert len(segment_files(tmp_path)) == 2
+    assert WriteAheadLog(str(tmp_path)).open() == [(1, b"whole"), (2, b"after")]
+
+
+def test_done_records_are_checkpointed_and_their_segments_deleted(tmp_path):
+    # Every record fills a segment, so each append after the first rotates
+    wal = WriteAheadLog(str(tmp_path), segment_bytes=1)
+    wal.open()
+    append_all(wal, [b"a", b"b", b"c", b"d"])
+    assert len(segment_files(tmp_path)) == 4
+
+    wal.done([1, 2, 4])
+    wal.close()
+    assert (tmp_path / CHECKPOINT_FILE).read_text() == "2"
+    assert segment_files(tmp_path) == [os.path.basename(segment_path(str(tmp_path), 3)),
+                                       os.path.basename(segment_path(str(tmp_path), 4))]
+    # Replay is at least once: record 4 is past the checkpoint
+    assert WriteAheadLog(str(tmp_path)).open() == [(3, b"c"), (4, b"d")]
+
+
+def test_dead_lettered_records_are_kept_out_of_replay(tmp_path):
+    wal = WriteAheadLog(str(tmp_path))
+    wal.open()
+    append_all(wal, [b"good", b"bad"])
+    crash(wal)
+
+    reopened = WriteAheadLog(str(tmp_path))
+    assert reopened.open() == [(1, b"good"), (2, b"bad")]
+    reopened.dead_letter(2, b"bad")
+    reopened.done([1])
+    reopened.close()
+    assert WriteAheadLog(str(tmp_path)).open() == []
+    assert list(read_segment(str(tmp_path / DEAD_LETTER_FILE))) == [(2, b"bad")]
+
+
+def test_log_recovers_in_a_new_segment_after_a_failed_write(tmp_path, monkeypatch):
+    wal = WriteAheadLog(str(tmp_path))
+    wal.open()
+    append_all(wal, [b"before"])
+
+    write = os.write
+
+    def full_disk(fd, data):
+        monkeypatch.setattr(wal_module.os, "write", write)
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(wal_module.os, "write", full_disk)
+    with pytest.raises(WalError):
+        append_all(wal, [b"lost"])
+    assert wal.stats()["error"] is not None
+
+    assert append_all(wal, [b"after"]) == [3]
+    assert wal.stats()["error"] is None
+    assert wal.recoveries == 1
+    wal.done([2])
+    crash(wal)
+    assert len(segment_files(tmp_path)) == 2
+    assert WriteAheadLog(str(tmp_path)).open() == [(1, b"before"), (3, b"after")]
+
+
+def test_records_written_before_a_failed_fsync_are_not_acknowledged(tmp_path, monkeypatch):
+    wal = WriteAheadLog(str(tmp_path))
+    wal.open()
+
+    fsync = os.fsync
+
+    def failing_fsync(fd):
+        monkeypatch.setattr(wal_module.os, "fsync", fsync)
+        raise OSError(errno.EIO, "Input/output error")
+
+    monkeypatch.setattr(wal_module.os, "fsync", failing_fsync)
+    with pytest.raises(WalError):
+        append_all(wal, [b"a", b"b"])
+
+    async def retry_then_sync_lost():
+        seq = wal.append(b"c")
+        await wal.sync(seq)
+        # Written before the failed fsync: a later fsync in the new segment does not cover it
+        with pytest.raises(WalError):
+            await wal.sync(2)
+        return seq
+
+    assert asyncio.run(retry_then_sync_lost()) == 3
+    wal.close()